@@ -0,0 +1,36 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+# Writing a file atomically, i.e: with atomic_write(path, 'w', encoding='utf-8') as f:
+# The content is written to a temporary file next to it, which then replaces the file, so an interrupted run never leaves half a file.
+# Each call writes its own temporary file, as several processes (i.e: the runs of several shards) may write the same file at the same time
+@contextmanager
+def atomic_write(path, mode='w', encoding=None):
+    f = tempfile.NamedTemporaryFile(mode, encoding=encoding, dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, path)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
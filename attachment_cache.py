@@ -0,0 +1,122 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from config import LOCAL_FILE_TRANSFER_FOLDER, ATTACHMENT_CACHE_MAX_BYTES
+from file_transfer import sftp_download_async
+from migration_logging import message_log
+
+# Folder of the cached attachments, inside the local file_transfer folder
+ATTACHMENT_CACHE_FOLDER = LOCAL_FILE_TRANSFER_FOLDER + 'cache' + os.sep
+
+# Global variables for the attachment cache, in least recently used order:
+# {key: {"local_path": ..., "size": ..., "download": Future, "pins": <number of messages using it>}}
+cache_entries = OrderedDict()
+cache_size = 0
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+cache_lock = threading.Lock()
+
+
+# Getting the cache key of an attachment: a hash of its file_server, remote path and size
+def attachment_cache_key(file_server, file_remote_path, file_size):
+    return hashlib.sha256((file_server + '\n' + file_remote_path + '\n' + str(file_size)).encode('utf-8')).hexdigest()
+
+# Getting an attachment to the local_folder, to be posted to Webex. Returns its handle:
+#   {"local_path": ..., "download": Future of the download, "cache_key": ...}
+# If ATTACHMENT_CACHE_MAX_BYTES is set, an attachment that was already downloaded (or is being downloaded)
+# for another message is served from the cache, without touching the file_server.
+# Otherwise it's downloaded to local_path, and deleted once released
+def fetch_attachment(file_server, file_remote_path, file_size, local_path):
+    global cache_size
+    if(ATTACHMENT_CACHE_MAX_BYTES <= 0):
+        message_log.info('\t\tDownloading to: %s', local_path)
+        return {"local_path": local_path, "download": sftp_download_async(file_server, file_remote_path, local_path), "cache_key": None}
+
+    key = attachment_cache_key(file_server, file_remote_path, file_size)
+    with cache_lock:
+        entry = cache_entries.get(key)
+        if(entry is not None):
+            cache_stats["hits"] += 1
+            cache_entries.move_to_end(key)
+            message_log.info('\t\tAttachment found in the cache: %s', entry["local_path"])
+        else:
+            cache_stats["misses"] += 1
+            Path(ATTACHMENT_CACHE_FOLDER).mkdir(parents=True, exist_ok=True)
+            message_log.info('\t\tDownloading to the attachment cache: %s', ATTACHMENT_CACHE_FOLDER + key)
+            entry = {"local_path": ATTACHMENT_CACHE_FOLDER + key, "size": file_size, "download": None, "pins": 0}
+            entry["download"] = sftp_download_async(file_server, file_remote_path, entry["local_path"])
+            cache_entries[key] = entry
+            cache_size += file_size
+        entry["pins"] += 1
+    return {"local_path": entry["local_path"], "download": entry["download"], "cache_key": key}
+
+# Releasing an attachment once its message was posted to Webex.
+# Cached attachments are kept (then evicted, least recently used first, when the cache is over ATTACHMENT_CACHE_MAX_BYTES),
+# other attachments are deleted from the local_folder right away
+def release_attachment(attachment):
+    if(attachment["cache_key"] is None):
+        remove_local_file(attachment["local_path"])
+        return
+
+    with cache_lock:
+        entry = cache_entries.get(attachment["cache_key"])
+        if(entry is None):
+            return
+        entry["pins"] -= 1
+        # A failed download is not kept, so the next message with the same attachment tries again
+        if(entry["pins"] == 0 and entry["download"].done() and entry["download"].exception() is not None):
+            evict_cache_entry(attachment["cache_key"])
+        evict_over_limit()
+
+# Evicting the least recently used attachments not in use, until the cache is back under ATTACHMENT_CACHE_MAX_BYTES.
+# Called with cache_lock held
+def evict_over_limit():
+    for key in list(cache_entries.keys()):
+        if(cache_size <= ATTACHMENT_CACHE_MAX_BYTES):
+            break
+        if(cache_entries[key]["pins"] == 0):
+            evict_cache_entry(key)
+            cache_stats["evictions"] += 1
+
+# Removing an attachment from the cache and from the local_folder. Called with cache_lock held
+def evict_cache_entry(key):
+    global cache_size
+    entry = cache_entries.pop(key)
+    cache_size -= entry["size"]
+    remove_local_file(entry["local_path"])
+
+# Deleting a file from the local_folder, if it's there
+def remove_local_file(local_path):
+    try:
+        os.remove(local_path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logging.info('Error: Unable to delete the local file: ' + local_path)
+
+# Emptying the cache at the end of the run, and logging how many attachments it served
+def clear_attachment_cache():
+    with cache_lock:
+        for key in list(cache_entries.keys()):
+            evict_cache_entry(key)
+    if(ATTACHMENT_CACHE_MAX_BYTES > 0):
+        logging.info('Attachment cache: ' + str(cache_stats["hits"]) + ' hits, ' + str(cache_stats["misses"]) +
+                     ' downloads, ' + str(cache_stats["evictions"]) + ' evictions')
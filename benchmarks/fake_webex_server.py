@@ -0,0 +1,233 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Email of the archiver user, returned by /people/me
+ARCHIVER_EMAIL = 'archiver@example.com'
+
+# Path answering the stats of the calls received (not counted as a call)
+STATS_PATH = '/_stats'
+
+
+# Local stand-in of the Webex APIs used by the scripts: people/me, rooms, memberships and messages.
+# Every call waits 'latency' seconds, and is answered with 429 (with a Retry-After of 'retry_after' seconds)
+# or with 503 for a 'rate_429' / 'rate_5xx' share of the calls, picked at random from 'seed'
+class FakeWebexServer(object):
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate_429=0.0, retry_after=1, rate_5xx=0.0, seed=1):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_5xx = rate_5xx
+        self.randomizer = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.rooms = {}
+        self.memberships = {}
+        self.calls = Counter()
+        self.statuses = Counter()
+        self.bytes_received = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://' + self.server.server_address[0] + ':' + str(self.server.server_address[1]) + '/v1/'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='FakeWebex', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Calls answered so far, by method and class of endpoints, and by status code
+    def stats(self):
+        with self.lock:
+            return {"calls": {method + ' ' + endpoint_class: calls for (method, endpoint_class), calls in self.calls.items()},
+                    "statuses": {str(status): responses for status, responses in self.statuses.items()},
+                    "bytes_received": self.bytes_received, "rooms": len(self.rooms)}
+
+    def new_id(self, prefix):
+        return prefix + str(next(self.ids))
+
+    # Picking the injected failure of a call, if any: 429 or 503
+    def injected_status(self):
+        with self.lock:
+            draw = self.randomizer.random()
+        if(draw < self.rate_429):
+            return 429
+        if(draw < self.rate_429 + self.rate_5xx):
+            return 503
+        return None
+
+    # Answering a call: returns (status, body, extra headers)
+    def handle(self, method, path, query, body):
+        endpoint = path[len('/v1/'):] if path.startswith('/v1/') else path
+        parts = endpoint.strip('/').split('/')
+        if(parts[0] == 'people' and method == 'GET'):
+            return 200, {"id": "archiver", "emails": [ARCHIVER_EMAIL], "displayName": "Archiver"}, {}
+
+        if(parts[0] == 'rooms' and method == 'POST'):
+            payload = json.loads(body or b'{}') if body[:1] == b'{' else parse_qs(body.decode())
+            title = payload.get("title")
+            title = title[0] if isinstance(title, list) else title
+            room_id = self.new_id('room-')
+            room = {"id": room_id, "title": title, "type": "group", "lastActivity": time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}
+            with self.lock:
+                self.rooms[room_id] = room
+                membership_id = self.new_id('membership-')
+                self.memberships[membership_id] = {"id": membership_id, "roomId": room_id, "personId": "archiver",
+                                                   "personEmail": ARCHIVER_EMAIL, "isModerator": True}
+            return 200, room, {}
+        if(parts[0] == 'rooms' and method == 'GET'):
+            with self.lock:
+                rooms = sorted(self.rooms.values(), key=lambda room: room["lastActivity"], reverse=True)
+            return self.page(path, query, rooms)
+
+        if(parts[0] == 'memberships' and method == 'POST'):
+            payload = json.loads(body)
+            with self.lock:
+                for membership in self.memberships.values():
+                    if(membership["roomId"] == payload["roomId"] and membership["personEmail"] == payload["personEmail"]):
+                        return 409, {"message": "User is already a participant"}, {}
+                membership_id = self.new_id('membership-')
+                membership = {"id": membership_id, "roomId": payload["roomId"], "personId": 'person-' + payload["personEmail"],
+                              "personEmail": payload["personEmail"], "isModerator": str(payload.get("isModerator")) == 'true'}
+                self.memberships[membership_id] = membership
+            return 200, membership, {}
+        if(parts[0] == 'memberships' and method == 'GET'):
+            # Without a room, only the memberships of the user calling the API (the archiver) are listed
+            if('roomId' not in query and 'personId' not in query and 'personEmail' not in query):
+                query = dict(query, personEmail=[ARCHIVER_EMAIL])
+            with self.lock:
+                memberships = [membership for membership in self.memberships.values()
+                               if(('roomId' not in query or membership["roomId"] == query['roomId'][0]) and
+                                  ('personId' not in query or membership["personId"] == query['personId'][0]) and
+                                  ('personEmail' not in query or membership["personEmail"] == query['personEmail'][0]))]
+            return self.page(path, query, memberships)
+        if(parts[0] == 'memberships' and method == 'DELETE' and len(parts) == 2):
+            with self.lock:
+                if(self.memberships.pop(parts[1], None) is None):
+                    return 404, {"message": "Membership not found"}, {}
+            return 204, None, {}
+
+        if(parts[0] == 'messages' and method == 'POST'):
+            return 200, {"id": self.new_id('message-'), "created": time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}, {}
+
+        return 404, {"message": "Not found"}, {}
+
+    # Answering a list of items by pages of 'max' items, with a 'Link' header to the next page
+    def page(self, path, query, items):
+        page_size = int(query.get('max', ['100'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        headers = {}
+        if(offset + page_size < len(items)):
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query['offset'] = str(offset + page_size)
+            headers['Link'] = '<' + self.url[:-len('/v1/')] + path + '?' + urlencode(next_query) + '>; rel="next"'
+        return 200, {"items": items[offset:offset + page_size]}, headers
+
+    def handler_class(self):
+        fake_server = self
+
+        class FakeWebexHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_request(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length > 0 else b''
+                if(url.path == STATS_PATH):
+                    return self.send_json(200, fake_server.stats(), {})
+                if(fake_server.latency > 0):
+                    time.sleep(fake_server.latency)
+
+                endpoint_class = url.path[len('/v1/'):].split('/')[0]
+                status = fake_server.injected_status()
+                headers = {}
+                if(status == 429):
+                    response = {"message": "Too Many Requests"}
+                    headers['Retry-After'] = str(fake_server.retry_after)
+                elif(status == 503):
+                    response = {"message": "Service Unavailable"}
+                else:
+                    status, response, headers = fake_server.handle(method, url.path, parse_qs(url.query), body)
+                with fake_server.lock:
+                    fake_server.calls[(method, endpoint_class)] += 1
+                    fake_server.statuses[status] += 1
+                    fake_server.bytes_received += len(body)
+
+                self.send_json(status, response, headers)
+
+            def send_json(self, status, response, headers):
+                content = json.dumps(response).encode() if response is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.do_request('GET')
+
+            def do_POST(self):
+                self.do_request('POST')
+
+            def do_DELETE(self):
+                self.do_request('DELETE')
+
+        return FakeWebexHandler
+
+
+# Running the server until the process is ended, i.e: in its own process, so it doesn't share the GIL with the migration being measured.
+# Its URL is put in 'url_queue' once it's listening
+def serve_fake_webex(url_queue, **options):
+    fake_webex = FakeWebexServer(**options)
+    url_queue.put(fake_webex.url)
+    fake_webex.server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local stand-in of the Webex APIs used by the migration scripts')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='share of the calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of the 429 responses, in seconds')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='share of the calls answered with 503')
+    args = parser.parse_args()
+    fake_webex = FakeWebexServer(port=args.port, latency=args.latency, rate_429=args.rate_429, retry_after=args.retry_after,
+                                 rate_5xx=args.rate_5xx)
+    print('Fake Webex API on: ' + fake_webex.url + ' (set WEBEX_API_URL to it)')
+    try:
+        fake_webex.server.serve_forever()
+    except KeyboardInterrupt:
+        fake_webex.stop()
@@ -0,0 +1,78 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import time
+import shutil
+import threading
+
+import file_transfer
+
+
+# Local stand-in of a file-transfer server's SFTP client, serving the files of 'files_folder' (i.e: the seeded attachments).
+# Only the calls used by file_transfer.py are served: get(), open() with stat() and read(), and close().
+# Every call waits 'latency' seconds, as a round trip to the file server would
+class LocalSFTPClient(object):
+    def __init__(self, files_folder, latency=0.0):
+        self.files_folder = files_folder
+        self.latency = latency
+
+    def local_path(self, remote_path):
+        return os.path.join(self.files_folder, remote_path.lstrip('/'))
+
+    def get(self, remote_path, local_path):
+        time.sleep(self.latency)
+        shutil.copyfile(self.local_path(remote_path), local_path)
+
+    def open(self, remote_path, mode='rb'):
+        time.sleep(self.latency)
+        return LocalSFTPFile(self.local_path(remote_path))
+
+    def close(self):
+        pass
+
+# Local file opened by LocalSFTPClient.open(), with the stat() of paramiko's SFTPFile
+class LocalSFTPFile(object):
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def stat(self):
+        return os.fstat(self.file.fileno())
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+# Local stand-in of the SSH connection, closed along with its SFTP client
+class LocalSSHClient(object):
+    def close(self):
+        pass
+
+# Replacing the SSH/SFTP connections of file_transfer.py by local ones serving 'files_folder', whatever the file_server host.
+# The pool of sessions, the downloads and the streamed uploads still run as in a real migration; only SSH is not involved.
+# Returns the number of sessions opened, updated as they are opened
+def install_local_sftp(files_folder, latency=0.0):
+    sessions_opened = {"count": 0}
+    lock = threading.Lock()
+
+    def connect_to_local_file_server(file_server):
+        with lock:
+            sessions_opened["count"] += 1
+        return (LocalSSHClient(), LocalSFTPClient(files_folder, latency))
+
+    file_transfer.connect_to_file_server = connect_to_local_file_server
+    return sessions_opened
@@ -0,0 +1,208 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+
+# The migration modules are in the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_map
+from main import markdown_msg_text_for_webex
+from jabber_xml import xml_get_jabber_attachment, xml_get_jabber_room_title
+
+# Baseline results stored in the repo, compared against with '--compare'
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro_baseline.json')
+
+# A slowdown is only a regression above this many standard deviations of the rounds, of the baseline or of the current run
+# (the noisier of the two), as the baseline may have been saved on a quieter or a busier machine
+NOISE_STDDEVS = 3
+
+# Domains of the generated users. config.py ships them empty, which would only time replace('', '') on the domain rewrite
+JABBER_DOMAIN = 'example.com'
+WEBEX_DOMAIN = 'webex.example.com'
+
+# Words of the generated messages: plain, unicode (accents, CJK, emojis), quotes, backslashes and markdown characters
+WORDS = ['hello', 'meeting', 'tomorrow', 'réunion', 'über', '会議', 'привет', '👍', '🎉', '"quoted"', "it's", 'C:\\path\\file',
+         '**bold**', '`code`', '<tag>', '&amp;', 'http://example.com/a?b=c']
+
+
+# Generating a message body of about 'length' characters, with a new line every 'line_words' words
+def generate_body(randomizer, length, line_words=12):
+    words = []
+    size = 0
+    while(size < length):
+        word = randomizer.choice(WORDS)
+        words.append(word + ('\n' if len(words) % line_words == line_words - 1 else ' '))
+        size += len(word) + 1
+    return ''.join(words)
+
+# Generating the message_string of a message with attachment, as stored in tc_msgarchive
+def generate_attachment_stanza(file_name, attachment_text):
+    return ("<message xmlns='jabber:client' to='room@conference.example.com' type='groupchat' id='" + 'x' * 20 + "'>"
+            "<body>Your chat application does not support downloading this file</body>"
+            "<advanced-file-transfer xmlns='http://cisco.com/aft'><fileid>" + 'f' * 32 + "</fileid><filename>" + file_name + "</filename>"
+            "<filesize>123456</filesize><mimetype>application/pdf</mimetype></advanced-file-transfer>"
+            "<aft-html xmlns='http://jabber.org/protocol/xhtml-im'><body xmlns='http://www.w3.org/1999/xhtml'>"
+            "<span style='font-family:Segoe UI;color:#1a1a1a'><div>" + attachment_text + "<div/></div></span></body></aft-html></message>")
+
+# Generating the config of a Jabber room, with 'fields' fields before its name
+def generate_room_config(title, fields):
+    return ("<x xmlns='jabber:x:data' type='submit'>" +
+            ''.join("<field type='text-single' var='muc#roomconfig_option" + str(i) + "'><value>value " + str(i) + "</value></field>"
+                    for i in range(fields)) +
+            "<field type='text-single' var='muc#roomconfig_roomname'><value>" + title + "</value></field></x>")
+
+def xml_escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+# The benchmarked calls, over generated inputs: {name: (function, args)}. The inputs are the same on every run (fixed seed)
+def build_cases():
+    randomizer = random.Random(1)
+    sent_date = '2020-06-01 09:30:00.000'
+    sender = 'john.doe@' + JABBER_DOMAIN
+
+    # User map of 100,000 users, as loaded from the Excel file, and the domains of the users missing from it
+    user_map.JABBER_DOMAIN = JABBER_DOMAIN
+    user_map.WEBEX_DOMAIN = WEBEX_DOMAIN
+    user_map.user_map = {('user' + str(i) + '@' + JABBER_DOMAIN).lower(): 'user' + str(i) + '@' + WEBEX_DOMAIN for i in range(100000)}
+    # The missing user is only warned about once, on the first lookup
+    user_map.unmapped_users.add('missing.user@' + JABBER_DOMAIN)
+
+    def with_user_map(jabber_id):
+        user_map.INCLUDE_JABBER_WEBEX_MAP = True
+        return user_map.webex_user_email(jabber_id)
+
+    def without_user_map(jabber_id):
+        user_map.INCLUDE_JABBER_WEBEX_MAP = False
+        return user_map.webex_user_email(jabber_id)
+
+    return {
+        "markdown_short": (markdown_msg_text_for_webex, (sender, sent_date, 'Hello in Jabber!')),
+        "markdown_quotes_newlines": (markdown_msg_text_for_webex, (sender, sent_date, 'He said "yes"\nand she said "no"\n\tthen \'maybe\'\\n')),
+        "markdown_unicode": (markdown_msg_text_for_webex, (sender, sent_date, generate_body(randomizer, 300))),
+        "markdown_long_body": (markdown_msg_text_for_webex, (sender, sent_date, generate_body(randomizer, 6000))),
+        "xml_attachment": (xml_get_jabber_attachment, (generate_attachment_stanza('report.pdf', 'Here is the report'),)),
+        "xml_attachment_unicode_text": (xml_get_jabber_attachment, (generate_attachment_stanza('résumé 会議.pdf',
+                                                                                               xml_escape(generate_body(randomizer, 2000))),)),
+        "xml_attachment_no_text": (xml_get_jabber_attachment,
+                                   ("<message xmlns='jabber:client'><advanced-file-transfer xmlns='http://cisco.com/aft'>"
+                                    "<filename>image.png</filename></advanced-file-transfer></message>",)),
+        "xml_room_title": (xml_get_jabber_room_title, (generate_room_config('Project room', 5),)),
+        "xml_room_title_large_config": (xml_get_jabber_room_title, (generate_room_config(xml_escape('Project room "&" <> 会議'), 200),)),
+        "user_map_hit": (with_user_map, ('User54321@' + JABBER_DOMAIN,)),
+        "user_map_miss_fallback": (with_user_map, ('missing.user@' + JABBER_DOMAIN,)),
+        "user_domain_rewrite": (without_user_map, ('user54321@' + JABBER_DOMAIN,)),
+    }
+
+# Timing a call: after a warm-up, the number of calls per round is picked so a round lasts about 'round_seconds',
+# then 'rounds' rounds are timed. Returns the stats of the time per call, in microseconds
+def measure(function, args, rounds, round_seconds):
+    calls = 1
+    while(True):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function(*args)
+        elapsed = time.perf_counter() - start
+        if(elapsed >= round_seconds / 10):
+            break
+        calls *= 10
+    calls = max(1, int(calls * round_seconds / max(elapsed, 1e-9)))
+
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function(*args)
+        times.append((time.perf_counter() - start) / calls * 1000000)
+    return {"min_us": round(min(times), 3), "median_us": round(statistics.median(times), 3), "mean_us": round(statistics.mean(times), 3),
+            "stddev_us": round(statistics.stdev(times), 3) if len(times) > 1 else 0.0, "rounds": rounds, "calls_per_round": calls,
+            "ops_per_second": round(1000000 / statistics.median(times), 1)}
+
+# Running the benchmarks whose name has 'name_filter', or only the ones listed in 'names'
+def run_micro_benchmarks(name_filter=None, rounds=15, round_seconds=0.2, names=None):
+    results = {}
+    for name, (function, args) in build_cases().items():
+        if((name_filter and name_filter not in name) or (names is not None and name not in names)):
+            continue
+        results[name] = measure(function, args, rounds, round_seconds)
+        print('%-30s median %10.3f us   min %10.3f us   stddev %8.3f us   %12.1f ops/s' % (
+            name, results[name]["median_us"], results[name]["min_us"], results[name]["stddev_us"], results[name]["ops_per_second"]))
+    return results
+
+# Comparing the results with a baseline, on the fastest round of each benchmark: the median of a sub-microsecond call moves
+# with the noise of the machine, its minimum much less. A benchmark is a regression when its minimum is slower than the baseline's
+# by more than its noise band: 'threshold' of the baseline, or NOISE_STDDEVS stddevs of the noisier run if larger.
+# Returns the list of regressed benchmarks
+def compare_with_baseline(results, baseline, threshold):
+    regressions = []
+    print('\n%-30s %12s %12s %9s' % ('Benchmark', 'Baseline us', 'Current us', 'Change'))
+    for name, result in results.items():
+        if(name not in baseline["results"]):
+            print('%-30s %12s %12.3f %9s' % (name, '-', result["min_us"], 'new'))
+            continue
+        baseline_min = baseline["results"][name]["min_us"]
+        change = result["min_us"] / baseline_min - 1
+        noise_band = max(threshold * baseline_min, NOISE_STDDEVS * max(result["stddev_us"], baseline["results"][name]["stddev_us"]))
+        flag = ''
+        if(result["min_us"] - baseline_min > noise_band):
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-30s %12.3f %12.3f %+8.1f%%%s' % (name, baseline_min, result["min_us"], change * 100, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the per-message and per-user functions of the migration')
+    parser.add_argument('--filter', help='only run the benchmarks whose name has this text')
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--round-seconds', type=float, default=0.2, help='duration of each timed round')
+    parser.add_argument('--save', nargs='?', const=BASELINE_FILE, metavar='FILE', help='save the results as the baseline')
+    parser.add_argument('--compare', nargs='?', const=BASELINE_FILE, metavar='FILE', help='compare the results with the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown of the fastest round flagged as a regression when comparing (0.2 = 20%%)')
+    parser.add_argument('--reruns', type=int, default=2, help='times a benchmark flagged as a regression is run again before failing')
+    args = parser.parse_args()
+
+    results = run_micro_benchmarks(args.filter, args.rounds, args.round_seconds)
+    if(args.save):
+        with open(args.save, 'w') as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "system": platform.system(),
+                       "results": results}, f, indent=4, sort_keys=True)
+            f.write('\n')
+        print('\nBaseline saved to: ' + args.save)
+    if(args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        # A benchmark flagged as a regression is run again, keeping its fastest run, as a single run may hit a busy moment of the machine
+        for _ in range(args.reruns):
+            if(len(regressions) == 0):
+                break
+            print('\nRunning again: ' + ', '.join(regressions))
+            rerun_results = run_micro_benchmarks(rounds=args.rounds, round_seconds=args.round_seconds, names=regressions)
+            for name in regressions:
+                results[name] = min(results[name], rerun_results[name], key=lambda result: result["min_us"])
+            regressions = compare_with_baseline({name: results[name] for name in regressions}, baseline, args.threshold)
+        if(len(regressions) > 0):
+            print('\n' + str(len(regressions)) + ' benchmark(s) more than ' + str(round(args.threshold * 100)) + '% slower than the baseline: ' +
+                  ', '.join(regressions))
+            sys.exit(1)
+        print('\nNo regression above ' + str(round(args.threshold * 100)) + '%')
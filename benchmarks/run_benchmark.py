@@ -0,0 +1,159 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from urllib.request import urlopen
+
+# The migration modules are in the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from seed_jabber_db import seed_jabber_db
+from fake_webex_server import serve_fake_webex, STATS_PATH
+
+
+# argparse - Reading the size of the seeded DB, the behaviour of the fake Webex API, and the config overrides
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run main.py end to end against a seeded SQLite Jabber DB, '
+                                                 'a local fake Webex API and a local SFTP stand-in, and report its throughput')
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--users', type=int, default=5, help='users per room')
+    parser.add_argument('--messages', type=int, default=200, help='messages per room')
+    parser.add_argument('--attachment-every', type=int, default=20, help='one message with attachment every N messages (0 for none)')
+    parser.add_argument('--attachment-size', type=int, default=100000, help='size of each attachment, in bytes')
+    parser.add_argument('--duplicate-files', type=float, default=0.0, help='share of attachments reusing a file posted before')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every Webex API call')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='share of the Webex API calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of the 429 responses, in seconds')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='share of the Webex API calls answered with 503')
+    parser.add_argument('--sftp-latency', type=float, default=0.005, help='seconds added to every SFTP get/open')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=JSON',
+                        help='config.py setting to override for the run, i.e: --set ROOM_WORKERS=4 --set ATTACHMENT_STREAMING=false')
+    parser.add_argument('--work-folder', help='folder of the seeded DB, files and logs (a new temporary folder by default)')
+    parser.add_argument('--json', metavar='FILE', help='also write the report to this JSON file')
+    return parser.parse_args()
+
+# Pointing config.py at the seeded DB, the fake Webex API and the work folder, before any migration module is imported
+# (they read their settings from config.py when imported). Then applying the '--set' overrides
+def setup_config(args, db_path, webex_url, work_folder):
+    for prefix in ('TC', 'MFT'):
+        setattr(config, prefix + '_DB_TYPE', 'sqlite')
+        setattr(config, prefix + '_DB_NAME', db_path)
+        setattr(config, prefix + '_DB_HOST', '')
+        setattr(config, prefix + '_DB_USER', '')
+        setattr(config, prefix + '_DB_PASSWORD', '')
+    config.WEBEX_AUTH = 'Bearer benchmark'
+    config.WEBEX_API_URL = webex_url
+    config.LOGS_FOLDER = os.path.join(work_folder, 'Logs') + os.sep
+    config.LOCAL_FILE_TRANSFER_FOLDER = os.path.join(work_folder, 'FT') + os.sep
+    config.INCLUDE_FILE_TRANSFER = args.attachment_every > 0
+    config.INCLUDE_JABBER_WEBEX_MAP = False
+    config.CREATE_WEBEX_ROOMS = True
+    config.CHECK_WEBEX_EXISTING_ROOMS = False
+    for setting in args.set:
+        name, value = setting.split('=', 1)
+        if(not hasattr(config, name)):
+            sys.exit('Unknown config.py setting: ' + name)
+        setattr(config, name, json.loads(value))
+    os.makedirs(config.LOGS_FOLDER, exist_ok=True)
+    os.makedirs(config.LOCAL_FILE_TRANSFER_FOLDER, exist_ok=True)
+
+# Peak memory of the process, in MB. Not available on Windows
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KB on Linux
+    if(sys.platform == 'darwin'):
+        return round(peak / 1000000, 1)
+    return round(peak / 1000, 1)
+
+def run_benchmark(args):
+    work_folder = args.work_folder or tempfile.mkdtemp(prefix='migration_benchmark_')
+    db_path = os.path.join(work_folder, 'jabber.db')
+    files_folder = os.path.join(work_folder, 'file_server')
+    seeded = seed_jabber_db(db_path, files_folder, args.rooms, args.users, args.messages, args.attachment_every,
+                            args.attachment_size, args.duplicate_files)
+
+    # The fake Webex API runs in its own process, so it doesn't slow down the migration being measured
+    url_queue = multiprocessing.Queue()
+    webex_process = multiprocessing.Process(target=serve_fake_webex, args=(url_queue,), daemon=True,
+                                            kwargs={"latency": args.latency, "rate_429": args.rate_429,
+                                                    "retry_after": args.retry_after, "rate_5xx": args.rate_5xx})
+    webex_process.start()
+    webex_url = url_queue.get(timeout=30)
+
+    setup_config(args, db_path, webex_url, work_folder)
+    import main
+    import metrics
+    from local_sftp import install_local_sftp
+    sftp_sessions = install_local_sftp(files_folder, args.sftp_latency)
+
+    sys.argv = ['main.py']
+    start = time.monotonic()
+    status = "completed"
+    try:
+        main.main()
+    except SystemExit:
+        # main.py ends the application with exit() on an error it can't recover from (see its log),
+        # what was measured up to there is still reported
+        status = "run aborted"
+    finally:
+        elapsed = time.monotonic() - start
+        with urlopen(webex_url[:-len('/v1/')] + STATS_PATH) as response:
+            webex_stats = json.loads(response.read())
+        webex_process.terminate()
+
+    messages = sum(value for (name, labels), value in metrics.counters.items() if name == "migration_messages_total")
+    webex_calls = sum(webex_stats["calls"].values())
+    retries = sum(value for (name, labels), value in metrics.counters.items() if name == "migration_webex_retries_total")
+    return {
+        "status": status,
+        "seeded": seeded,
+        "settings": {"latency": args.latency, "rate_429": args.rate_429, "rate_5xx": args.rate_5xx,
+                     "sftp_latency": args.sftp_latency, "set": args.set},
+        "seconds": round(elapsed, 2),
+        "messages": messages,
+        "messages_per_second": round(messages / elapsed, 2) if elapsed > 0 else None,
+        "webex_calls": webex_calls,
+        "webex_calls_per_message": round(webex_calls / messages, 3) if messages > 0 else None,
+        "webex_calls_by_endpoint": webex_stats["calls"],
+        "webex_statuses": webex_stats["statuses"],
+        "webex_429": webex_stats["statuses"].get("429", 0),
+        "webex_5xx": sum(responses for status, responses in webex_stats["statuses"].items() if status.startswith('5')),
+        "webex_retries": retries,
+        "sftp_sessions": sftp_sessions["count"],
+        "peak_rss_mb": peak_rss_mb(),
+        "work_folder": work_folder,
+    }
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=4))
+    if(args.json):
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=4)
+    if(report["status"] != "completed"):
+        sys.exit('The migration was aborted, see its log in: ' + report["work_folder"])
@@ -0,0 +1,105 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import random
+import sqlite3
+import argparse
+import datetime
+
+# Body of the Jabber messages that have attachment/s, as stored in tc_msgarchive
+ATTACHMENT_MSG_BODY = 'Your chat application does not support downloading this file'
+
+# Name of the file-transfer server of the seeded aft_log records
+SEEDED_FILE_SERVER = 'benchmark-file-server'
+
+
+# sqlite3 - Seeding a SQLite DB with the tables read by the migration: tc_rooms, tc_users, tc_msgarchive and aft_log.
+# Every 'attachment_every' message of a room is a message with attachment, with its aft_log record and its file saved in 'files_folder'.
+# 'duplicate_files' is the share of attachments reusing a file posted before, as the same document is often posted to many rooms
+def seed_jabber_db(db_path, files_folder, rooms, users, messages, attachment_every=10, attachment_size=10000, duplicate_files=0.0, seed=1):
+    randomizer = random.Random(seed)
+    if(os.path.exists(db_path)):
+        os.remove(db_path)
+    os.makedirs(files_folder, exist_ok=True)
+
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE tc_rooms (room_jid TEXT PRIMARY KEY, config TEXT)")
+    db.execute("CREATE TABLE tc_users (room_jid TEXT, real_jid TEXT, role TEXT, affiliation TEXT)")
+    db.execute("CREATE TABLE tc_msgarchive (msg_id INTEGER PRIMARY KEY, to_jid TEXT, from_jid TEXT, sent_date TEXT, "
+               "body_string TEXT, message_string TEXT)")
+    db.execute("CREATE INDEX tc_msgarchive_room ON tc_msgarchive (to_jid, sent_date, msg_id)")
+    db.execute("CREATE TABLE aft_log (to_jid TEXT, real_filename TEXT, method TEXT, timestampvalue TEXT, file_server TEXT, "
+               "file_path TEXT, bytes_transferred INTEGER)")
+
+    msg_id = 0
+    files = []
+    start_date = datetime.datetime(2020, 1, 1, 9, 0, 0)
+    for room in range(rooms):
+        room_jid = 'room' + str(room) + '@conference.example.com'
+        config = ("<x xmlns='jabber:x:data' type='submit'><field var='FORM_TYPE'><value>http://jabber.org/protocol/muc#roomconfig</value></field>"
+                  "<field type='text-single' var='muc#roomconfig_roomname'><value>Benchmark room " + str(room) + "</value></field></x>")
+        db.execute("INSERT INTO tc_rooms VALUES (?, ?)", (room_jid, config))
+        for user in range(users):
+            affiliation = 'owner' if user == 0 else 'member'
+            db.execute("INSERT INTO tc_users VALUES (?, ?, ?, ?)",
+                       (room_jid, 'user' + str(user) + '@example.com/jabber', 'participant', affiliation))
+
+        messages_rows = []
+        aft_log_rows = []
+        for message in range(messages):
+            msg_id += 1
+            sent_date = start_date + datetime.timedelta(seconds=message * 7)
+            sender = 'user' + str(message % max(users, 1)) + '@example.com'
+            if(attachment_every > 0 and message % attachment_every == attachment_every - 1):
+                # Reusing a file posted before, or saving a new one to the file-transfer server's folder
+                if(len(files) > 0 and randomizer.random() < duplicate_files):
+                    file_name, file_path = randomizer.choice(files)
+                else:
+                    file_name = 'document' + str(len(files)) + '.txt'
+                    file_path = '/' + file_name
+                    with open(os.path.join(files_folder, file_name), 'wb') as f:
+                        f.write(randomizer.getrandbits(8 * attachment_size).to_bytes(attachment_size, 'little'))
+                    files.append((file_name, file_path))
+                stanza = ("<message xmlns='jabber:client' to='" + room_jid + "' type='groupchat'><body>" + ATTACHMENT_MSG_BODY + "</body>"
+                          "<advanced-file-transfer xmlns='http://cisco.com/aft'><filename>" + file_name + "</filename></advanced-file-transfer>"
+                          "<aft-html xmlns='http://jabber.org/protocol/xhtml-im'><body xmlns='http://www.w3.org/1999/xhtml'>"
+                          "<span><div>Attachment " + str(msg_id) + "<div/></div></span></body></aft-html></message>")
+                messages_rows.append((msg_id, room_jid, sender, sent_date.strftime('%Y-%m-%d %H:%M:%S.000'), ATTACHMENT_MSG_BODY, stanza))
+                aft_log_rows.append((room_jid, file_name, 'Post', sent_date.strftime('%Y-%m-%d %H:%M:%S'), SEEDED_FILE_SERVER, file_path,
+                                     attachment_size))
+            else:
+                body = 'Message ' + str(msg_id) + ' of room ' + str(room) + ': "quoted" text\nwith a second line'
+                messages_rows.append((msg_id, room_jid, sender, sent_date.strftime('%Y-%m-%d %H:%M:%S.000'), body, "<message/>"))
+        db.executemany("INSERT INTO tc_msgarchive VALUES (?, ?, ?, ?, ?, ?)", messages_rows)
+        db.executemany("INSERT INTO aft_log VALUES (?, ?, ?, ?, ?, ?, ?)", aft_log_rows)
+    db.commit()
+    db.close()
+    return {"rooms": rooms, "users": rooms * users, "messages": msg_id, "files": len(files)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed a SQLite Jabber DB (tc_rooms, tc_users, tc_msgarchive, aft_log) for the benchmarks')
+    parser.add_argument('db_path')
+    parser.add_argument('--files-folder', default='benchmark_files', help='folder of the seeded attachments files')
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--users', type=int, default=5, help='users per room')
+    parser.add_argument('--messages', type=int, default=100, help='messages per room')
+    parser.add_argument('--attachment-every', type=int, default=10, help='one message with attachment every N messages (0 for none)')
+    parser.add_argument('--attachment-size', type=int, default=10000, help='size of each attachment, in bytes')
+    parser.add_argument('--duplicate-files', type=float, default=0.0, help='share of attachments reusing a file posted before')
+    args = parser.parse_args()
+    print(seed_jabber_db(args.db_path, args.files_folder, args.rooms, args.users, args.messages, args.attachment_every,
+                         args.attachment_size, args.duplicate_files))
@@ -39,6 +39,11 @@ TC_DB_PASSWORD = "<password_here>"
 # for messages with attachments (False)
 INCLUDE_FILE_TRANSFER = False
 
+# An attachment's file_transfer record is searched in the managed file transfer DB by the message's time (down to the second).
+# If there is no record at the exact time, the closest one within +/-AFT_TIME_TOLERANCE seconds is used
+# Only if INCLUDE_FILE_TRANSFER was set to True
+AFT_TIME_TOLERANCE = 3
+
 # Managed file transfer DB
 # Only if INCLUDE_FILE_TRANSFER was set to True
 MFT_DB_TYPE = "<db_type>"
@@ -53,6 +58,26 @@ FILE_SERVER_HOST = '<hostname_or_ip_address_here>'
 FILE_SERVER_USER = '<username_here>'
 FILE_SERVER_PASSWORD = '<password_here>'
 
+# Attachments are downloaded from the file-transfer servers by FILE_DOWNLOAD_WORKERS workers in parallel,
+# ahead of posting their messages, over a pool of up to SFTP_POOL_SIZE_PER_HOST authenticated SFTP sessions per server
+# Only if INCLUDE_FILE_TRANSFER was set to True
+FILE_DOWNLOAD_WORKERS = 4
+SFTP_POOL_SIZE_PER_HOST = 4
+
+# This boolean variable is to choose to stream each attachment from the file-transfer server straight into its Webex upload (True),
+# or to download it to LOCAL_FILE_TRANSFER_FOLDER first (False). The file is read from the server by blocks of
+# ATTACHMENT_STREAM_BUFFER_SIZE bytes while being uploaded, so at most one block per upload is held in memory
+# Only if INCLUDE_FILE_TRANSFER was set to True
+ATTACHMENT_STREAMING = False
+ATTACHMENT_STREAM_BUFFER_SIZE = 1048576
+
+# Size limit in bytes of the local attachment cache, inside LOCAL_FILE_TRANSFER_FOLDER. An attachment posted again (in the same room or another one)
+# is served from the cache instead of being downloaded again from the file-transfer server; the least recently used attachments are
+# deleted when the cache is over the limit, and the cache is emptied at the end of the run. Set to 0 to disable the cache:
+# each attachment is then downloaded for its message, and deleted once posted
+# Only if INCLUDE_FILE_TRANSFER was set to True, and ATTACHMENT_STREAMING to False
+ATTACHMENT_CACHE_MAX_BYTES = 1000000000
+
 # This boolean variable is to choose to migrate the detected Jabber rooms to Webex (True),
 # or just use this script to read the existing Jabber rooms and their details and save them in a log (False)
 CREATE_WEBEX_ROOMS = True
@@ -62,12 +87,90 @@ CREATE_WEBEX_ROOMS = True
 # or not checking the existing Webex rooms' titles and just create new ones anyway (False)
 CHECK_WEBEX_EXISTING_ROOMS = False
 
+# Only if CHECK_WEBEX_EXISTING_ROOMS was set to True
+# This boolean variable is to choose to match the Jabber rooms titles with the Webex ones regardless of their case and extra spaces (True),
+# or only the exact same titles (False)
+WEBEX_ROOMS_TITLE_NORMALIZE = False
+# This boolean variable is to choose to keep the list of existing Webex rooms in a local cache in LOGS_FOLDER (True), so the next runs only read
+# the rooms active since the previous run, or to list all the rooms on each run (False). Delete the cache file to list all the rooms again
+WEBEX_ROOMS_CACHE = True
+
 # Webex Authorization
 # Only if CREATE_WEBEX_ROOMS was set to True
-WEBEX_AUTH = 'Bearer <webex_user_token>'
+# It can also be set by the WEBEX_AUTH environment variable, i.e: to use another archiver's token for each shard of the rooms (main.py --shard K/N)
+WEBEX_AUTH = os.environ.get('WEBEX_AUTH', 'Bearer <webex_user_token>')
+
+# Webex API base URL, and the number of keep-alive connections to Webex shared by all the workers of a script.
+# Connections are reused across API calls and rooms. Keep the pool size at least equal to ROOM_WORKERS
+WEBEX_API_URL = "https://webexapis.com/v1/"
+WEBEX_HTTP_POOL_SIZE = 10
+
+# Webex API rate limits, as requests per second, shared by all the workers of a script.
+# Each class of endpoints has its own limit, calls to other endpoints use the 'default' one.
+# Calls are slowed down to these rates before Webex answers with 429 (Too Many Requests),
+# and once a 429 is received, all the calls are held until its Retry-After is over, then retried up to WEBEX_MAX_RETRIES times.
+# Calls answered with a server error (5xx) or failing to connect are also retried, up to WEBEX_MAX_RETRIES times,
+# after WEBEX_RETRY_BACKOFF seconds, doubled on each retry
+WEBEX_RATE_LIMITS = {"messages": 5, "memberships": 5, "rooms": 1, "default": 5}
+WEBEX_MAX_RETRIES = 5
+WEBEX_RETRY_BACKOFF = 1
+
+# Number of users added to a Webex room concurrently, after listing the room's members once to only add the missing ones
+# and the number of memberships removed concurrently by rollback_webex_rooms.py
+# The memberships calls are still limited by WEBEX_RATE_LIMITS["memberships"]
+MEMBERSHIP_WORKERS = 4
+
+# This boolean variable is to choose to pack consecutive text messages of a room into a single archived Webex message (True),
+# keeping the sender and time of each of them, or to post each Jabber message as its own Webex message (False).
+# Fewer Webex API calls are needed for busy rooms. Messages are packed up to the size limit of Webex messages, and only while they were
+# sent within COALESCE_WINDOW of the first packed message: 'day' for the same day, or a number of minutes (i.e: 30)
+# Only if CREATE_WEBEX_ROOMS was set to True
+COALESCE_MESSAGES = False
+COALESCE_WINDOW = 'day'
+
+# Every room, membership and message done in Webex is recorded to a migration journal in LOGS_FOLDER, to be able
+# to resume an interrupted run with: python main.py --resume "<journal_file_name>".
+# Set to True to also sync each journal record to disk (safer against a machine crash, but slower)
+JOURNAL_FSYNC = False
+
+# Logs are written by a background thread, so the workers don't wait for the disk or the console.
+# This boolean variable is to choose to log the details of every message and of its Webex API calls (True),
+# or only the rooms, users, errors and the summary of each room (False), which is faster for large migrations
+LOG_MESSAGE_DETAILS = True
+# This boolean variable is to choose to also write a structured log, one JSON object per line, next to the log file: '<log file>.jsonl' (True)
+LOG_JSON_LINES = False
+
+# The metrics of the run (latency of the Webex API calls, DB queries and SFTP transfers, Webex status codes, 429s and retries,
+# bytes transferred, messages) are written in the Prometheus text format to LOGS_FOLDER + METRICS_FILE_NAME every METRICS_INTERVAL seconds,
+# and summarized in the log at the end of the run. Set METRICS_INTERVAL to 0 to only write the file at the end of the run
+METRICS_FILE_NAME = 'migration_metrics.prom'
+METRICS_INTERVAL = 15
+
+# Number of Jabber rooms whose users are read from the Persistent Chat DB in a single query.
+# Keep it under 1000, the limit of values in a query's IN (...) list for some DBs (i.e: Oracle)
+DB_ROOM_BATCH_SIZE = 500
+
+# The messages of a room are streamed from the Persistent Chat DB by pages of MSG_PAGE_SIZE messages, in chronological order.
+# Set MSG_PAGE_PAUSE to a number of seconds to wait between pages, to limit the load on the DB
+MSG_PAGE_SIZE = 1000
+MSG_PAGE_PAUSE = 0
+
+# The messages of each room go through a pipeline of stages, each in its own threads: reading them from the DB (1 thread),
+# parsing their XML and formatting their markdown (PIPELINE_TRANSFORM_WORKERS threads), downloading their attachments
+# (FILE_DOWNLOAD_WORKERS threads) and posting them to Webex, in their original order (1 thread per room, see ROOM_WORKERS).
+# Up to PIPELINE_MAX_IN_FLIGHT messages of a room (and their downloaded attachments) are kept ahead of the one being posted
+PIPELINE_TRANSFORM_WORKERS = 2
+PIPELINE_MAX_IN_FLIGHT = 100
+
+# Number of Jabber rooms to migrate to Webex at the same time.
+# Each room is still migrated by a single worker, so its users and messages keep their original order
+ROOM_WORKERS = 1
 
 # Do you have an Excel file that maps Jabber usernames to Webex emails?
 INCLUDE_JABBER_WEBEX_MAP = True
+# Only if INCLUDE_JABBER_WEBEX_MAP was set to True. The users missing from the Excel file get their Jabber domain
+# replaced by JABBER_DOMAIN -> WEBEX_DOMAIN (True), or keep their Jabber ID as is (False)
+USER_MAP_DOMAIN_FALLBACK = True
 
 
 # These 2 variables are only needed if Jabber IM messaging uses a different domain than Webex domain.
@@ -81,4 +184,4 @@ LOGS_FOLDER = os.path.dirname(os.path.realpath(__file__)) + '\\Logs\\'
 
 # Folder to store the files being transferred from Jabber's external file-server to Webex as attachments
 # If not changed: it will create a sub-folder of the current location called 'FileTransfer'
-LOCAL_FILE_TRANSFER_FOLDER = os.path.dirname(os.path.realpath(__file__)) + '\\FileTransfer\\'
\ No newline at end of file
+LOCAL_FILE_TRANSFER_FOLDER = os.path.dirname(os.path.realpath(__file__)) + '\\FileTransfer\\'
@@ -0,0 +1,223 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import count, observe
+
+# Importing the file_transfer server credentials and the pool settings
+from config import FILE_SERVER_USER, FILE_SERVER_PASSWORD
+from config import SFTP_POOL_SIZE_PER_HOST, FILE_DOWNLOAD_WORKERS, ATTACHMENT_STREAM_BUFFER_SIZE
+
+# Global variables for the pool of authenticated SFTP sessions, per file_server host:
+# the idle sessions ready to be used, and the number of sessions opened to each host.
+# Workers waiting for a session are notified through sftp_pool_condition when a session is released or fails
+sftp_idle_sessions = {}
+sftp_open_sessions = {}
+sftp_pool_lock = threading.Lock()
+sftp_pool_condition = threading.Condition(sftp_pool_lock)
+
+# Global variable for the download throughput of each file_server host: files, bytes and seconds spent downloading
+file_server_stats = {}
+
+# Global variable for the download workers, created on the first download
+download_executor = None
+
+
+# paramiko - Create an ftp_connection to a remote file server. To be able to get/put files from/to it.
+# Returns the session as (ssh_client, ftp_client), to be able to close both
+def connect_to_file_server(file_server):
+    # paramiko is only loaded when connecting to the first file_server, so it's not needed when INCLUDE_FILE_TRANSFER is False
+    import paramiko
+    try:
+        # Connect to the file_server using SSH
+        ssh_client = paramiko.SSHClient()
+        # Policy for automatically adding the hostname and new host key to the local HostKeys object, and saving it
+        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh_client.connect(file_server, username=FILE_SERVER_USER,
+                           password=FILE_SERVER_PASSWORD)
+        logging.info('Completed connection to Managed File Transfer Server: ' + file_server)
+
+        # Using SFTP client for file transfer of message attachments
+        ftp_client = ssh_client.open_sftp()
+        return (ssh_client, ftp_client)
+    except:
+        logging.info('Error: Unable to connect to Jabber\'s external file_transfer: ' +
+              file_server + ' to retrieve message attachments..')
+        exit()
+
+# Taking an SFTP session to the given host from the pool. An idle session is reused if there is one,
+# otherwise a new one is opened, up to SFTP_POOL_SIZE_PER_HOST sessions per host; then it waits for a session to be released,
+# or for a session to fail, to open a new one in its place
+def sftp_checkout(file_server):
+    with sftp_pool_condition:
+        while(True):
+            idle_sessions = sftp_idle_sessions.setdefault(file_server, [])
+            if(len(idle_sessions) > 0):
+                return idle_sessions.pop()
+            if(sftp_open_sessions.get(file_server, 0) < SFTP_POOL_SIZE_PER_HOST):
+                sftp_open_sessions[file_server] = sftp_open_sessions.get(file_server, 0) + 1
+                break
+            sftp_pool_condition.wait()
+    try:
+        return connect_to_file_server(file_server)
+    except BaseException:
+        with sftp_pool_condition:
+            sftp_open_sessions[file_server] -= 1
+            sftp_pool_condition.notify()
+        raise
+
+# Giving an SFTP session back to the pool, or closing it if it failed. Either way, a waiting worker is notified:
+# to take the released session, or to open a new one in place of the failed one
+def sftp_release(file_server, session, failed=False):
+    if(failed):
+        close_sftp_session(session)
+    with sftp_pool_condition:
+        if(failed):
+            sftp_open_sessions[file_server] -= 1
+        else:
+            sftp_idle_sessions[file_server].append(session)
+        sftp_pool_condition.notify()
+
+# Closing both the SFTP client and its SSH connection
+def close_sftp_session(session):
+    ssh_client, ftp_client = session
+    try:
+        ftp_client.close()
+        ssh_client.close()
+    except:
+        logging.info('Error closing the connection to a Managed File Transfer Server..')
+
+# paramiko - Downloading a file from the file_server to a local path, using a pooled SFTP session
+def sftp_download(file_server, file_remote_path, local_path):
+    session = sftp_checkout(file_server)
+    try:
+        start = time.monotonic()
+        session[1].get(file_remote_path, local_path)
+        elapsed = time.monotonic() - start
+        file_size = os.path.getsize(local_path)
+    except BaseException:
+        sftp_release(file_server, session, failed=True)
+        raise
+    sftp_release(file_server, session)
+    record_file_server_stats(file_server, file_size, elapsed, "download")
+
+# Starting a file download on the download workers (FILE_DOWNLOAD_WORKERS), returning its Future
+def sftp_download_async(file_server, file_remote_path, local_path):
+    global download_executor
+    with sftp_pool_lock:
+        if(download_executor is None):
+            download_executor = ThreadPoolExecutor(max_workers=FILE_DOWNLOAD_WORKERS, thread_name_prefix='Download')
+    return download_executor.submit(sftp_download, file_server, file_remote_path, local_path)
+
+# paramiko - Streaming a file from the file_server straight into an upload, without saving it to the local_folder.
+# 'upload' is called with a function opening the remote file as a stream (called again if the upload is retried),
+# and the stream is read while the upload is being sent, holding at most ATTACHMENT_STREAM_BUFFER_SIZE bytes in memory.
+# Only the time spent reading from the file_server is recorded to its throughput, not the time spent uploading to Webex
+def sftp_stream_upload(file_server, file_remote_path, upload):
+    session = sftp_checkout(file_server)
+    opened_streams = []
+
+    def open_attachment():
+        for stream in opened_streams:
+            stream.close()
+        stream = SftpAttachmentStream(session[1].open(file_remote_path, 'rb'))
+        opened_streams.append(stream)
+        return stream
+
+    try:
+        result = upload(open_attachment)
+    except BaseException:
+        sftp_release(file_server, session, failed=True)
+        raise
+    for stream in opened_streams:
+        stream.close()
+    sftp_release(file_server, session)
+    if(len(opened_streams) > 0):
+        record_file_server_stats(file_server, sum(stream.bytes_read for stream in opened_streams),
+                                 sum(stream.read_seconds for stream in opened_streams), "stream")
+    return result
+
+# Remote SFTP file read by the multipart encoder of a Webex upload, in blocks of ATTACHMENT_STREAM_BUFFER_SIZE bytes.
+# The encoder reads the file in small chunks, and needs the number of bytes left to read as its 'len'.
+# 'read_seconds' is the time spent reading from the file_server, without the time the encoder spends sending the data
+class SftpAttachmentStream(object):
+    def __init__(self, remote_file):
+        self.remote_file = remote_file
+        self.remaining = remote_file.stat().st_size
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.buffer = b''
+        self.buffer_offset = 0
+
+    @property
+    def len(self):
+        return self.remaining
+
+    def read(self, size=-1):
+        if(size is None or size < 0):
+            size = self.remaining
+        # Reading the next block from the file_server once the buffered one was consumed
+        if(self.buffer_offset >= len(self.buffer) and self.remaining > 0):
+            start = time.monotonic()
+            self.buffer = self.remote_file.read(ATTACHMENT_STREAM_BUFFER_SIZE)
+            self.read_seconds += time.monotonic() - start
+            self.buffer_offset = 0
+            # The file is shorter than its size when opened, nothing more to send
+            if(len(self.buffer) == 0):
+                self.remaining = 0
+        data = self.buffer[self.buffer_offset:self.buffer_offset + size]
+        self.buffer_offset += len(data)
+        self.remaining -= len(data)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        self.remote_file.close()
+
+# Adding a transferred file to the throughput of its file_server host, and to the metrics of the run.
+# 'mode' is how it was transferred: "download" to the local_folder, or "stream" into its upload
+def record_file_server_stats(file_server, file_size, elapsed, mode):
+    observe("migration_sftp_get_seconds", {"file_server": file_server, "mode": mode}, elapsed)
+    count("migration_sftp_bytes_total", {"file_server": file_server, "mode": mode}, file_size)
+    with sftp_pool_lock:
+        stats = file_server_stats.setdefault(file_server, {"files": 0, "bytes": 0, "seconds": 0.0})
+        stats["files"] += 1
+        stats["bytes"] += file_size
+        stats["seconds"] += elapsed
+
+# Logging the download throughput of each file_server host
+def log_file_server_stats():
+    for file_server, stats in file_server_stats.items():
+        throughput = 0
+        if(stats["seconds"] > 0):
+            throughput = stats["bytes"] / stats["seconds"] / 1000000
+        logging.info('File_server: ' + file_server + '\t' + str(stats["files"]) + ' files, ' + str(stats["bytes"]) +
+                     ' bytes in ' + str(round(stats["seconds"], 2)) + ' seconds (' + str(round(throughput, 2)) + ' MB/s)')
+
+# Stopping the download workers and closing all the pooled SFTP sessions, at the end of the run
+def close_file_servers():
+    global download_executor
+    if(download_executor is not None):
+        download_executor.shutdown(wait=True)
+        download_executor = None
+    with sftp_pool_lock:
+        for file_server, idle_sessions in sftp_idle_sessions.items():
+            while(len(idle_sessions) > 0):
+                close_sftp_session(idle_sessions.pop())
+            sftp_open_sessions[file_server] = 0
@@ -0,0 +1,163 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import time
+import zlib
+import logging
+import bisect
+import datetime
+from sqlalchemy import create_engine, text, bindparam, select, and_, or_
+from sqlalchemy.sql import table, column
+
+from config import MSG_PAGE_SIZE, MSG_PAGE_PAUSE
+from metrics import timed
+
+# Queries against Jabber's Persistent Chat DB. All the values are passed as bound parameters
+
+# Jabber Rooms #
+# Add a 'where' condition to the sql command to only get specific rooms
+# Example:
+# "SELECT room_jid, config FROM tc_rooms WHERE room_jid = '<room_jid_here>'"
+ROOMS_QUERY = text("SELECT room_jid, config FROM tc_rooms")
+
+# Jabber Users # of a batch of rooms, in a single query
+ROOMS_USERS_QUERY = text(
+    "SELECT room_jid, real_jid, affiliation FROM tc_users WHERE role != 'moderator' AND room_jid IN :room_jids"
+).bindparams(bindparam('room_jids', expanding=True))
+
+# Jabber Messages # table, used to build the paged messages queries for each DB type (i.e: LIMIT, TOP or FETCH FIRST)
+tc_msgarchive = table('tc_msgarchive', column('msg_id'), column('to_jid'), column('sent_date'),
+                      column('from_jid'), column('body_string'), column('message_string'))
+
+MESSAGE_SENT_DATE_QUERY = text("SELECT sent_date FROM tc_msgarchive WHERE msg_id = :msg_id")
+
+# Queries against Jabber's Managed File Transfer DB
+# File_transfer records of the attachments posted to a room
+AFT_LOG_QUERY = text(
+    "SELECT real_filename, timestampvalue, file_server, file_path, bytes_transferred FROM aft_log WHERE method = 'Post' AND to_jid = :room_jid")
+
+
+# SQLAlchemy - Creating the engine to connect to one of Jabber's external DBs, keeping up to 'pool_size' connections open.
+# 'sqlite' DBs (i.e: the seeded DBs of the benchmarks) are opened from the file named 'db_name', and shared by the workers' threads
+def jabber_db_create_engine(db_type, db_host, db_name, db_user, db_password, pool_size):
+    if(db_type.startswith('sqlite')):
+        return create_engine(db_type + ':///' + db_name, connect_args={'check_same_thread': False})
+    return create_engine(db_type + '://' + db_user + ':' + db_password + '@' + db_host + '/' + db_name, pool_size=pool_size)
+
+# SQLAlchemy - Getting the list of all the Jabber rooms with their config (Name/Title), in one query.
+# Returns a list of (room_jid, config)
+def jabber_db_get_rooms(conn):
+    with timed("migration_db_query_seconds", {"query": "rooms"}):
+        return [(row[0], row[1]) for row in conn.execute(ROOMS_QUERY)]
+
+# Keeping the rooms of a shard, when the migration is split across several processes or hosts with: --shard K/N.
+# Each room belongs to a single shard, picked by a stable hash of its room_jid, so it's the same on every host and every run
+def jabber_rooms_shard(jabber_rooms, shard_number, shard_count):
+    return [j_room for j_room in jabber_rooms if zlib.crc32(str(j_room[0]).encode('utf-8')) % shard_count == shard_number - 1]
+
+# SQLAlchemy - Getting the users of a batch of rooms in one query, grouped by room.
+# Returns a dict of {room_jid: [(real_jid, affiliation), ...]}, with an entry for every room of the batch
+def jabber_db_get_rooms_users(conn, room_jids):
+    rooms_users = {room_jid: [] for room_jid in room_jids}
+    if(len(room_jids) == 0):
+        return rooms_users
+    with timed("migration_db_query_seconds", {"query": "rooms_users"}):
+        for row in conn.execute(ROOMS_USERS_QUERY, room_jids=list(room_jids)):
+            rooms_users[row[0]].append((row[1], row[2]))
+    return rooms_users
+
+# SQLAlchemy - Streaming the messages of a room in chronological order: (sent_date, from_jid, body_string, message_string, msg_id).
+# Messages are read by pages of MSG_PAGE_SIZE, each page starting after the (sent_date, msg_id) of the previous one,
+# so no page is buffered twice, and no statement is left open on the DB between pages.
+# MSG_PAGE_PAUSE seconds are waited between pages to limit the load on the DB.
+# 'after_msg_id' starts the stream right after this message, i.e: the last message posted by an interrupted run.
+# Its sent_date is read right away, as the stream can't continue from a message that is no longer in tc_msgarchive
+def jabber_db_stream_room_messages(conn, room_jid, after_msg_id=None):
+    last_key = None
+    if(after_msg_id is not None):
+        with timed("migration_db_query_seconds", {"query": "message_sent_date"}):
+            last_sent_date = conn.execute(MESSAGE_SENT_DATE_QUERY, msg_id=after_msg_id).scalar()
+        if(last_sent_date is None):
+            logging.info('Error: The last message posted to the room: ' + str(room_jid) + ' (msg_id: ' + str(after_msg_id) +
+                         ') is no longer in tc_msgarchive, so the room can\'t be resumed after it. Ending application...')
+            exit()
+        last_key = (last_sent_date, after_msg_id)
+    return jabber_db_stream_messages_pages(conn, room_jid, last_key)
+
+# SQLAlchemy - Reading the pages of messages of jabber_db_stream_room_messages, starting after 'last_key': (sent_date, msg_id)
+def jabber_db_stream_messages_pages(conn, room_jid, last_key):
+    while(True):
+        query = select([tc_msgarchive.c.sent_date, tc_msgarchive.c.from_jid, tc_msgarchive.c.body_string,
+                        tc_msgarchive.c.message_string, tc_msgarchive.c.msg_id]).where(tc_msgarchive.c.to_jid == room_jid)
+        if(last_key is not None):
+            query = query.where(or_(tc_msgarchive.c.sent_date > last_key[0],
+                                    and_(tc_msgarchive.c.sent_date == last_key[0], tc_msgarchive.c.msg_id > last_key[1])))
+        query = query.order_by(tc_msgarchive.c.sent_date, tc_msgarchive.c.msg_id).limit(MSG_PAGE_SIZE)
+
+        with timed("migration_db_query_seconds", {"query": "messages_page"}):
+            page = conn.execute(query).fetchall()
+        for j_msg in page:
+            yield j_msg
+        if(len(page) < MSG_PAGE_SIZE):
+            return
+        last_key = (page[-1][0], page[-1][4])
+        if(MSG_PAGE_PAUSE > 0):
+            time.sleep(MSG_PAGE_PAUSE)
+
+# SQLAlchemy - Reading all the file_transfer records of a room from aft_log in one query, and indexing them in memory:
+# {(to_jid, real_filename): {"timestamps": [sorted timestamps], "records": [(file_server, file_path, bytes_transferred), ...]}}
+def jabber_db_get_aft_log_index(conn_mft, room_jid):
+    aft_log_index = {}
+    with timed("migration_db_query_seconds", {"query": "aft_log"}):
+        aft_log_rows = conn_mft.execute(AFT_LOG_QUERY, room_jid=room_jid).fetchall()
+    for row in aft_log_rows:
+        if(row[1] is None):
+            continue
+        entries = aft_log_index.setdefault((room_jid, str(row[0])), [])
+        entries.append((jabber_db_to_datetime(row[1]), (str(row[2]), str(row[3]), row[4])))
+
+    for key in aft_log_index:
+        entries = sorted(aft_log_index[key], key=lambda entry: entry[0])
+        aft_log_index[key] = {"timestamps": [entry[0] for entry in entries], "records": [entry[1] for entry in entries]}
+    return aft_log_index
+
+# Finding the file_transfer record of an attachment in the room's aft_log index: the record of the same file name,
+# with the closest timestamp to the message's sent_date, within +/-tolerance seconds. On a tie, the earlier record is used.
+# Returns (file_server, file_path, bytes_transferred), or None if no record was found
+def aft_log_find_record(aft_log_index, room_jid, file_name, sent_date, tolerance):
+    entries = aft_log_index.get((room_jid, file_name))
+    if(entries is None):
+        return None
+    msg_time = jabber_db_to_datetime(sent_date)
+    timestamps = entries["timestamps"]
+
+    # The closest record is either the first one at/after the message time, or the one just before it
+    position = bisect.bisect_left(timestamps, msg_time)
+    best = None
+    for candidate in (position - 1, position):
+        if(0 <= candidate < len(timestamps)):
+            distance = abs((timestamps[candidate] - msg_time).total_seconds())
+            if(distance <= tolerance and (best is None or distance < best[0])):
+                best = (distance, candidate)
+    if(best is None):
+        return None
+    return entries["records"][best[1]]
+
+# Converting a DB timestamp (a datetime, or a string for some DB drivers) to a datetime down to the second,
+# matching the managed file transfer DB's timing format
+def jabber_db_to_datetime(value):
+    if(isinstance(value, datetime.datetime)):
+        return value.replace(microsecond=0)
+    return datetime.datetime.strptime(str(value)[0:19], '%Y-%m-%d %H:%M:%S')
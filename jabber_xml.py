@@ -0,0 +1,106 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import logging
+import threading
+from lxml import etree
+
+from migration_logging import message_log
+
+# Precompiled XPath expressions, matching the elements by their local name whatever their namespace
+# <message><advanced-file-transfer><filename>
+AFT_FILE_NAME_XPATH = etree.XPath("/*/*[local-name()='advanced-file-transfer']/*[local-name()='filename']")
+# <message><aft-html><body><span><div>
+AFT_TEXT_XPATH = etree.XPath("/*/*[local-name()='aft-html']/*[local-name()='body']/*[local-name()='span']/*")
+# <x><field var='muc#roomconfig_roomname'><value>
+ROOM_NAME_XPATH = etree.XPath("/*/*[@var='muc#roomconfig_roomname']/*")
+TEXT_NODES_XPATH = etree.XPath("text()")
+
+# lxml parsers can't be shared between threads: each room worker gets its own, reused for all its messages
+xml_parsers = threading.local()
+
+
+# Getting the XML parser of the current thread. Entities are not resolved, and no network access is done
+def get_xml_parser():
+    parser = getattr(xml_parsers, 'parser', None)
+    if(parser is None):
+        parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        xml_parsers.parser = parser
+    return parser
+
+# lxml - Parsing the message_string of a message with attachment once, to get both:
+# its file name and the message that is written alongside the attachment file. From a similar xml structure of:
+'''
+<message ... >
+    <advanced-file-transfer ... >
+        ...
+        <filename>file_name</filename>
+        ...
+    </advanced-file-transfer>
+    <aft-html ... >
+        <body ... >
+            <span ... >
+                <div>
+                    attachment_text
+                    <div ...>
+                    </div>
+                </div>
+            </span>
+        </body>
+    </aft-html>
+</message>
+'''
+# Returns {"file_name": ..., "attachment_text": ...}. The file name is empty if the message has no <filename>,
+# so no file_transfer record is matched to it
+def xml_get_jabber_attachment(msg_string_xml):
+    xml_root = etree.fromstring(msg_string_xml, get_xml_parser())
+
+    file_name = ''
+    file_name_elements = AFT_FILE_NAME_XPATH(xml_root)
+    if(len(file_name_elements) > 0):
+        file_name = str(file_name_elements[-1].text)
+        message_log.info('\t\tfile_name: %s', file_name)
+
+    # The text included with attachments; if it exists
+    attachment_text = ''
+    text_elements = AFT_TEXT_XPATH(xml_root)
+    if(len(text_elements) > 0):
+        attachment_text = " ".join(t for t in TEXT_NODES_XPATH(text_elements[-1]))
+        message_log.info('\t\tText with the attachment: %s', attachment_text)
+
+    return {"file_name": file_name, "attachment_text": attachment_text}
+
+# lxml - Parsing the output of Jabber room's config' field, and getting the Room Name/Title
+def xml_get_jabber_room_title(config_xml):
+    # Getting Room name from a similar xml structure of:
+    '''
+    <x ... >
+        <field ...>
+            <value>...</value>
+        <field ... var='muc#roomconfig_roomname'>
+            <value>result_here</value>
+        <field>
+    </x>
+    '''
+    xml_root = etree.fromstring(config_xml, get_xml_parser())
+
+    # Get the room name/title from the value of the field: var='muc#roomconfig_roomname'
+    j_room_title = ''
+    value_elements = ROOM_NAME_XPATH(xml_root)
+    if(len(value_elements) > 0):
+        j_room_title = str(value_elements[-1].text)
+
+    logging.info('Jabber Room Title: ' + j_room_title)
+    return j_room_title
@@ -13,10 +13,17 @@ writing, software distributed under the License is distributed on an "AS
 IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
-import requests
+import time
+# Time the script started, to report the startup time
+START_TIME = time.monotonic()
+
 import json
 import logging
-from config import WEBEX_AUTH, LOGS_FOLDER
+from config import LOGS_FOLDER, MEMBERSHIP_WORKERS
+from webex_client import webex_api_request, webex_api_call_concurrently
+from webex_rooms_index import webex_get_my_memberships_index
+from webex_summary import read_webex_summary
+from migration_logging import setup_migration_logging
 
 # Global variable to store the information for the user running this script
 global archiver_info
@@ -26,29 +33,34 @@ global archiver_info
 def leave():
     global archiver_info
     
+    # The time spent waiting for the file name isn't part of the startup time
+    input_start = time.monotonic()
     json_file_name = input('Please enter (or paste) the file name of Webex Json Summary to leave generated rooms:\n')
+    input_time = time.monotonic() - input_start
     
+    # The summary is read one room at a time, on each pass over its rooms
+    summary_file_path = LOGS_FOLDER + json_file_name
     try:
-        with open(LOGS_FOLDER + json_file_name) as f:
-            json_data = json.load(f)
+        next(read_webex_summary(summary_file_path), None)
     except:
         logging.info('File failed to load. Please make sure of the file name and location')
         exit()
     
     # Setting up the logger to store the rollback process
-    logging.basicConfig(filename=LOGS_FOLDER + json_file_name + ' -Leave.log', level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
-    logging.getLogger().addHandler(logging.StreamHandler())
+    setup_migration_logging(LOGS_FOLDER + json_file_name + ' -Leave.log')
     logging.info("-"*25 + " Started " + "-"*25)
     logging.info('File: '+ json_file_name)
+    logging.info('Startup time: ' + str(round(time.monotonic() - START_TIME - input_time, 2)) + ' seconds')
 
     # Read the json file and display the summary of the data that was found
-    display_found_rooms(json_data)
+    display_found_rooms(summary_file_path)
     
     # Getting the information for the user running this script
     archiver_info = webex_api_get_archiver_details()
 
     # After removing the users from the rooms, ask the archiver user if to leave the created rooms
-    archiver_leaving_all_rooms(json_data)
+    # The result of each room is written to a report next to the summary
+    archiver_leaving_all_rooms(summary_file_path, LOGS_FOLDER + json_file_name + ' -Leave report.jsonl')
 
     logging.info('-'*20 + ' Ending the application ' + '-'*20)
 
@@ -57,12 +69,9 @@ def webex_api_get_archiver_details():
     global archiver_info
     try:
         archiver_info = {"id": "", "email": ""}
-        url = "https://webexapis.com/v1/people/me"
+        endpoint = "people/me"
         payload = {}
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = webex_api_request("GET", endpoint, data=payload)
         res_dict = json.loads(response.text)
         archiver_info["id"] = res_dict["id"]
         archiver_info["email"] = res_dict["emails"][0]
@@ -73,54 +82,39 @@ def webex_api_get_archiver_details():
         exit()
 
 # Read the json file and display the summary of the data that was found
-def display_found_rooms(json_data):
-    # logging.info('Data:\n' + str(json_data))
+def display_found_rooms(summary_file_path):
     num_of_rooms = 0
-    for element in json_data:
+    for element in read_webex_summary(summary_file_path):
         # logging.info('Element:' + str(element))
         if "webex_room" in element:
             num_of_rooms += 1
             logging.info('#'*5 + ' Room #' + str(num_of_rooms) + ': ' + element["webex_room"]["title"])
 
-# Webex API - Removing a user from a room usingthe room Id and the user's email. Using Memberships APIs
-def webex_api_remove_user_from_room(w_room_id, w_user_email):
-    global archiver_info
-    w_memb_id = ''
-    logging.info('-'*3 + 'Calling Webex API to remove user: ' + w_user_email)
-
-    # List the existing webex memberships
-    logging.info('-'*3 + ' Calling Webex API to get the user\'s membership:')
-    url = "https://webexapis.com/v1/memberships" + "?roomId=" + w_room_id + "&personEmail=" + w_user_email
-    payload = {}
-    headers = {
-        'Authorization': WEBEX_AUTH
-    }
-    response = requests.request("GET", url, headers=headers, data=payload)
+# Webex API - Deleting a membership of the archiver user, to leave its room. Using Memberships APIs.
+# Returns the result of the room: "left", "not_a_member" (the membership no longer exists) or "error"
+def webex_api_delete_membership(w_room_title, w_memb_id):
+    logging.info('-'*3 + ' Calling Webex API to leave the room: ' + w_room_title)
+    endpoint = "memberships" + "/" + w_memb_id
+    try:
+        response = webex_api_request("DELETE", endpoint)
+    except Exception:
+        logging.info('Error leaving the room: ' + w_room_title)
+        return "error"
     logging.info("\tResponse Code:" + str(response.status_code) +
-          ' (' + str(response.reason) + ')')
-
-    res_dict = json.loads(response.text)
-    webex_memberships = res_dict["items"]
-
-    for w_memb in webex_memberships:
-        w_memb_id = w_memb["id"]        
-
-    if(w_memb_id == ''):
-        logging.info('Membership not found. User is no longer part of the room..')
-    else:
-        # Delete a membership
-        logging.info('-'*3 + ' Calling Webex API to delete the membership: ')
-        url = "https://webexapis.com/v1/memberships" + "/" + w_memb_id
-        payload = {}
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("DELETE", url, headers=headers, data=payload)
-        logging.info("\tResponse Code:" + str(response.status_code) +
-          ' (' + str(response.reason) + ')')
+          ' (' + str(response.reason) + ') for: ' + w_room_title)
+    if(response.status_code == 401):
+        logging.info('Webex authentication credentials are missing or incorrect.\nEnding application...')
+        exit()
+    if(response.status_code == 404):
+        return "not_a_member"
+    if(response.status_code >= 400):
+        logging.info('Error leaving the room: ' + w_room_title)
+        return "error"
+    return "left"
 
 # After removing the users from the rooms, ask the archiver user if to leave the created rooms
-def archiver_leaving_all_rooms(json_data):
+# The result of each room is written to 'report_file_name', one line per room: {"title": ..., "id": ..., "result": ...}
+def archiver_leaving_all_rooms(summary_file_path, report_file_name):
     global archiver_info
 
     invalid_choice = True
@@ -139,15 +133,43 @@ def archiver_leaving_all_rooms(json_data):
         else:
             logging.info('Incorrect choice,, please check your input')
     if(leave_rooms):
-        num_of_rooms = 0
-        w_room_id = ''
-        for element in json_data:
-            if "webex_room" in element:
-                num_of_rooms += 1
-                logging.info('#'*5 + ' Room #' + str(num_of_rooms) + ': ' + element["webex_room"]["title"])
-                w_room_id = element["webex_room"]["id"]
-            if "room_users" in element:
-                webex_api_remove_user_from_room(w_room_id,archiver_info["email"])
+        # All the archiver's memberships are listed once, then its membership in each room is found in the index
+        try:
+            w_memberships = webex_get_my_memberships_index()
+        except Exception:
+            logging.info('Error listing the memberships of the archiver user..')
+            exit()
+
+        results = {"left": 0, "not_a_member": 0, "error": 0}
+        with open(report_file_name, 'w', encoding='utf-8') as report_file:
+            def record_result(room, result):
+                w_room = room[0]
+                if(result == "not_a_member"):
+                    logging.info('The archiver user is not part of the room: ' + w_room["title"])
+                results[result] += 1
+                report_file.write(json.dumps({"title": w_room["title"], "id": w_room["id"], "result": result}) + '\n')
+
+            # The rooms are left by MEMBERSHIP_WORKERS concurrent calls, while they are read from the summary
+            webex_api_call_concurrently(leave_room, summary_rooms(summary_file_path, w_memberships), record_result, MEMBERSHIP_WORKERS, 'Leave')
+
+        logging.info('Rooms left: ' + str(results["left"]) + ', not a member: ' + str(results["not_a_member"]) +
+                     ', errors: ' + str(results["error"]))
+        logging.info('Report: ' + report_file_name)
+
+# Reading the rooms to leave from the summary, one room at a time, with the archiver's membership in each of them (or None):
+# (room, membership ID)
+def summary_rooms(summary_file_path, w_memberships):
+    for element in read_webex_summary(summary_file_path):
+        if "webex_room" in element:
+            w_room = element["webex_room"]
+            yield (w_room, w_memberships.get(w_room["id"]))
+
+# Leaving a room of the summary, unless the archiver user has no membership in it: returns "left", "not_a_member" or "error"
+def leave_room(w_room, w_memb_id):
+    if(w_memb_id is None):
+        return "not_a_member"
+    return webex_api_delete_membership(w_room["title"], w_memb_id)
 
                 
-leave()
\ No newline at end of file
+if __name__ == '__main__':
+    leave()
@@ -13,410 +13,647 @@ writing, software distributed under the License is distributed on an "AS
 IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
-import requests
-from sqlalchemy import create_engine
-from lxml import etree                                                                               
-import json
 import time
-import paramiko
+# Time the script started, to report the startup time
+START_TIME = time.monotonic()
+
+import json
+import argparse
 import logging
 import datetime
-import pandas as pd
 from pathlib import Path
-from requests_toolbelt.multipart.encoder import MultipartEncoder
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_EXCEPTION
+from webex_client import webex_api_request, webex_api_paginate, close_webex_session
+from jabber_db import jabber_db_create_engine, jabber_db_get_rooms, jabber_db_get_rooms_users, jabber_db_stream_room_messages
+from jabber_db import jabber_db_get_aft_log_index, aft_log_find_record, jabber_rooms_shard
+from file_transfer import sftp_stream_upload, close_file_servers, log_file_server_stats
+from attachment_cache import fetch_attachment, release_attachment, clear_attachment_cache
+from webex_rooms_index import webex_get_rooms_index, webex_room_title_key
+from jabber_xml import xml_get_jabber_attachment, xml_get_jabber_room_title
+from user_map import load_user_map, webex_user_email
+from migration_logging import setup_migration_logging, stop_migration_logging, message_log
+from metrics import count, start_metrics_writer, stop_metrics_writer
+from message_coalescing import MessageCoalescer
+from message_pipeline import run_pipeline
+from migration_journal import open_migration_journal, journal_record, close_migration_journal, load_migration_journal
+from webex_summary import open_webex_summary, write_summary_record, close_webex_summary
 
 # Importing the connection variables: Jabber External DBs, Webex's Auth, and file_transfer server information
-from config import LOGS_FOLDER, LOCAL_FILE_TRANSFER_FOLDER
+from config import LOGS_FOLDER, LOCAL_FILE_TRANSFER_FOLDER, METRICS_FILE_NAME
 from config import TC_DB_TYPE, TC_DB_HOST, TC_DB_NAME, TC_DB_USER, TC_DB_PASSWORD
 from config import MFT_DB_TYPE, MFT_DB_HOST, MFT_DB_NAME, MFT_DB_USER, MFT_DB_PASSWORD
-from config import WEBEX_AUTH, CREATE_WEBEX_ROOMS, CHECK_WEBEX_EXISTING_ROOMS
-from config import INCLUDE_FILE_TRANSFER, FILE_SERVER_HOST, FILE_SERVER_USER, FILE_SERVER_PASSWORD
-
-# Importing Jabber domain and Webex domain, in case they are different
-from config import INCLUDE_JABBER_WEBEX_MAP, JABBER_DOMAIN, WEBEX_DOMAIN
-
-# Setting up logging time to write new logs each time the script is run.
-now = str(datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
-
-# Creating Logs folder, if it doesn't exist
-if (not Path(LOGS_FOLDER).exists()):
-    Path(LOGS_FOLDER).mkdir()
-
-# Global variable to save Webex generated data in JSON format
-global webex_json_data
-global webex_room_dict
-global webex_room_users
-
-# If the user will migrate the rooms to Webex, the log file will be named: 'Migrate chat to Webex',
-# and will create another log 'Webex generated rooms' and a json file 'Webex json summary' storing the activities done in Webex.
-# Otherwise if the script is run to only read Jabber's data, the log file will be named: 'Read chat only'
-if(CREATE_WEBEX_ROOMS):
-    logging.basicConfig(filename=LOGS_FOLDER + now + ' - Migrate chat to Webex.log', level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
-    webex_json_summary = logging.getLogger('Webex JSON summary')
-    webex_json_summary.addHandler(logging.FileHandler(LOGS_FOLDER + now + ' - Webex json summary.json'))
-    webex_json_summary.setLevel(level=logging.INFO)
-    webex_json_data = []
-    webex_room_dict = {}
-    webex_room_users = []
-    
-else:
-    logging.basicConfig(filename=LOGS_FOLDER + now + ' - Read chat only.log', level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
-
-# Displaying the output on the console
-logging.getLogger().addHandler(logging.StreamHandler())
-logging.info("-"*25 + " Started " + "-"*25)
-
-# Setting SQLALchemy engine to connect to Jabber external databases
-tc_engine = create_engine(TC_DB_TYPE + '://' + TC_DB_USER +
-                          ':' + TC_DB_PASSWORD + '@' + TC_DB_HOST + '/' + TC_DB_NAME)
+from config import CREATE_WEBEX_ROOMS, CHECK_WEBEX_EXISTING_ROOMS, ROOM_WORKERS, DB_ROOM_BATCH_SIZE, MEMBERSHIP_WORKERS
+from config import WEBEX_MAX_RETRIES
+from config import INCLUDE_FILE_TRANSFER, AFT_TIME_TOLERANCE, FILE_DOWNLOAD_WORKERS, ATTACHMENT_STREAMING
+from config import PIPELINE_TRANSFORM_WORKERS, PIPELINE_MAX_IN_FLIGHT
+from config import COALESCE_MESSAGES
+
+# Importing the choice of mapping Jabber IDs to Webex emails with an Excel file
+from config import INCLUDE_JABBER_WEBEX_MAP
+
+# Body of the Jabber messages that have attachment/s
+ATTACHMENT_MSG_BODY = 'Your chat application does not support downloading this file'
+
+# Limit of Webex message attachments (100MB)
+WEBEX_MAX_FILE_SIZE = 100000000
+
+# Global variables set up when the script starts: the time used in the logs file names,
+# and the SQLAlchemy engines to connect to Jabber external databases
+now = None
+tc_engine = None
+mft_engine = None
+
+
+# Setting up the logs: a new log file each time the script is run, also displayed on the console
+def setup_logging(shard=None):
+    global now
+
+    # Setting up logging time to write new logs each time the script is run.
+    # When migrating a shard of the rooms, the shard is added to the names of the logs, journal and summary of the run
+    now = str(datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+    if(shard is not None):
+        now += ' - Shard ' + str(shard[0]) + ' of ' + str(shard[1])
+
+    # Creating Logs folder, if it doesn't exist
+    if (not Path(LOGS_FOLDER).exists()):
+        Path(LOGS_FOLDER).mkdir()
+
+    # If the user will migrate the rooms to Webex, the log file will be named: 'Migrate chat to Webex',
+    # and will create a json-lines file 'Webex json summary' storing the activities done in Webex, written as the rooms are migrated.
+    # Otherwise if the script is run to only read Jabber's data, the log file will be named: 'Read chat only'
+    # When migrating several rooms at once, the room worker is shown in each log line.
+    # The log lines are written in the background, also displayed on the console
+    if(CREATE_WEBEX_ROOMS):
+        setup_migration_logging(LOGS_FOLDER + now + ' - Migrate chat to Webex.log', show_thread_name=(ROOM_WORKERS > 1))
 
-if(INCLUDE_FILE_TRANSFER):
-    mft_engine = create_engine(MFT_DB_TYPE + '://' + MFT_DB_USER +
-                            ':' + MFT_DB_PASSWORD + '@' + MFT_DB_HOST + '/' + MFT_DB_NAME)
+    else:
+        setup_migration_logging(LOGS_FOLDER + now + ' - Read chat only.log', show_thread_name=(ROOM_WORKERS > 1))
 
-if INCLUDE_JABBER_WEBEX_MAP:
-    map_df = pd.read_excel("jabber_to_webex.xlsx")
-    num_rows = len(map_df)
+    logging.info("-"*25 + " Started " + "-"*25)
 
-    map_dict = {}
-    for row in range(num_rows):
-        jabber_id = map_df.loc[row, "jabber_id"]
-        webex_email = map_df.loc[row, "webex_email"]
-        map_dict[jabber_id] = webex_email
+# Setting SQLALchemy engine to connect to Jabber external databases
+# Each room worker holds its own connections, on top of the main one reading the list of rooms
+def setup_db_engines():
+    global tc_engine, mft_engine
+    tc_engine = jabber_db_create_engine(TC_DB_TYPE, TC_DB_HOST, TC_DB_NAME, TC_DB_USER, TC_DB_PASSWORD, pool_size=ROOM_WORKERS + 1)
 
-    print(map_dict)
+    if(INCLUDE_FILE_TRANSFER):
+        mft_engine = jabber_db_create_engine(MFT_DB_TYPE, MFT_DB_HOST, MFT_DB_NAME, MFT_DB_USER, MFT_DB_PASSWORD, pool_size=ROOM_WORKERS)
 
 # Main function having the full script to read Jabber's persistent chat from External DB.
 # And create the rooms, with their list of users, and messaages to Webex using its APIs
 def main():
-    global webex_json_data
-    global webex_room_dict
-    global webex_room_users
+    # Reading the command line options, i.e: '--resume <journal_file_name>' or '--shard K/N'
+    args = parse_arguments()
+
+    # Nothing is set up when the script is imported: the logs, the DB engines and the user map are set up here.
+    # Optional modules (i.e: paramiko for file_transfer, openpyxl for the user map) are only loaded when used
+    setup_logging(args.shard)
+    setup_db_engines()
+
+    # Loading the map of Jabber IDs to Webex emails (from its cache, unless the Excel file was modified)
+    if INCLUDE_JABBER_WEBEX_MAP:
+        try:
+            load_user_map("jabber_to_webex.xlsx")
+        except:
+            logging.info('Error: Unable to read the user map: jabber_to_webex.xlsx')
+            exit()
+    logging.info('Startup time: ' + str(round(time.monotonic() - START_TIME, 2)) + ' seconds')
+
+    # Writing the metrics of the run (Webex, DB and SFTP latencies, status codes, bytes, messages) to LOGS_FOLDER every METRICS_INTERVAL seconds
+    if(args.shard is not None):
+        start_metrics_writer('shard-' + str(args.shard[0]) + '-of-' + str(args.shard[1]) + '_' + METRICS_FILE_NAME)
+    else:
+        start_metrics_writer()
+
     # Connection to DB
     try:
         # Connect to persistance Chat DB
         conn = tc_engine.connect()
         logging.info('Completed connection to Persistant Chat DB')
-
-        # Connect to Managed File Transfer DB
-        if(INCLUDE_FILE_TRANSFER):
-            conn_mft = mft_engine.connect()
-            logging.info('Completed connection to Managed File Transfer DB')
     except:
         logging.info(
             'Error: Unable to connect to Jabber\'s external DBs for chat and file_transfer logs..')
         exit()
 
-    # Connection to File Transfer Server
-    # current_connection variable to keep the latest connection up, to deal with multiple file_server hosts
-    if(INCLUDE_FILE_TRANSFER):
-        current_connection = FILE_SERVER_HOST
-        ftp_client = connect_to_file_server(current_connection)
+    archiver_info = None
+
+    # Progress of an interrupted run, read from its journal when resuming it
+    journal = {"archiver_user": None, "shard": None, "rooms": {}}
+    run_shard = shard_text(args.shard)
 
     # Getting the archiver details: ID & email, before going through the list of users.
     # To determine if the archiver needs to leave the room after adding the users and messages
     if(CREATE_WEBEX_ROOMS):
+        # Recording every room, membership and message to the migration journal, as soon as they are done in Webex.
+        # When resuming, the same journal is read then continued
+        if(args.resume):
+            journal_file_name = LOGS_FOLDER + args.resume
+            try:
+                journal = load_migration_journal(journal_file_name)
+            except:
+                logging.info('Journal failed to load. Please make sure of the file name and location')
+                exit()
+            # The rooms of another shard would be migrated twice, by this run and by the other shard's
+            if(journal["shard"] != run_shard):
+                logging.info('The journal is of shard: ' + str(journal["shard"]) + ', not: ' + str(run_shard) +
+                             '. Please resume it with the same --shard option')
+                exit()
+            logging.info('Resuming the migration from the journal: ' + args.resume)
+        else:
+            journal_file_name = LOGS_FOLDER + now + ' - Migration journal.jsonl'
+        open_migration_journal(journal_file_name)
+        if(run_shard is not None and journal["shard"] is None):
+            journal_record({"type": "shard", "shard": run_shard})
+
+        # Webex generated data, written to the json summary one room at a time, as soon as each room is migrated
+        open_webex_summary(LOGS_FOLDER + now + ' - Webex json summary.jsonl')
+
         archiver_info = webex_api_get_archiver_details()
-        
-        # If CHECK_WEBEX_EXISTING_ROOMS is set to True, get the list of existing Webex_rooms titles
+        if(run_shard is not None):
+            write_summary_record({"archiver_user": archiver_info, "shard": run_shard})
+        else:
+            write_summary_record({"archiver_user": archiver_info})
+        if(journal["archiver_user"] is None):
+            journal_record({"type": "archiver_user", "archiver_user": archiver_info})
+        elif(journal["archiver_user"]["email"] != archiver_info["email"]):
+            logging.info('Warning: The journal was written by another archiver user: ' + journal["archiver_user"]["email"])
+
+        # If CHECK_WEBEX_EXISTING_ROOMS is set to True, get the index of existing Webex_rooms titles
         if(CHECK_WEBEX_EXISTING_ROOMS):
-            webex_titles = webex_api_get_existing_rooms()
+            webex_titles = webex_api_get_existing_rooms(archiver_info)
 
     # Jabber Rooms #
-    # Execute a query to list all the available Jabber rooms in DB.
-    # Add a 'where' condition to the sql command to only get specific rooms
-    # Example:
-    # jabber_rooms = conn.execute("SELECT room_jid FROM tc_rooms where room_jid=<room_jid_here>'")
-    jabber_rooms = conn.execute("SELECT room_jid FROM tc_rooms")
-
-    # Loop throught the list of rooms and treat each room separately
-    num_of_rooms = 0
-  
-    for j_room in jabber_rooms:
-
-        num_of_rooms += 1
-        logging.info('#'*25 + ' Room-' + str(num_of_rooms) + ' ' + '#'*25)
-
-        # Storing room details in variables: room_id, room_title, room_subject
-        j_room_id = j_room[0]
-        logging.info('Jabber Room ID: ' + j_room_id)
-        j_room_title = ''
-
-        # Execute a query to get Room details: Name/Title
-        room_config = conn.execute(
-            "SELECT config FROM tc_rooms where room_jid = '" + j_room_id + "'")
-        room_config = room_config.fetchone()
-
-        # Get the room title/name from config xml result from DB
-        j_room_title = xml_get_jabber_room_title(room_config[0])
-
-        # Webex API  - Room Creation #
-        # Create a room in Webex matching Jabber room (Title)
-        if(CREATE_WEBEX_ROOMS):
-            # If the user wanted to check Webex exisiting rooms' titles
-            if(CHECK_WEBEX_EXISTING_ROOMS):
-                room_matched = False
-                for w_title in webex_titles:
+    # Execute a query to list all the available Jabber rooms in DB, with their config (Name/Title).
+    # Add a 'where' condition to ROOMS_QUERY in jabber_db.py to only get specific rooms
+    jabber_rooms = jabber_db_get_rooms(conn)
+    logging.info('Found ' + str(len(jabber_rooms)) + ' Jabber rooms')
+
+    # When the migration is split across several processes or hosts, only the rooms of this run's shard are migrated
+    if(args.shard is not None):
+        jabber_rooms = jabber_rooms_shard(jabber_rooms, args.shard[0], args.shard[1])
+        logging.info('Migrating the ' + str(len(jabber_rooms)) + ' rooms of shard: ' + run_shard)
+
+    # Rooms are migrated by a pool of ROOM_WORKERS workers, each room is handled by a single worker
+    # so its users and messages keep their original order
+    logging.info('Migrating rooms using ' + str(ROOM_WORKERS) + ' worker(s)')
+    room_futures = []
+    # Rooms that failed, as soon as they fail: the migration is ended without waiting for the rooms before them
+    failed_rooms = []
+
+    def check_room_failure(room_future):
+        if(not room_future.cancelled() and room_future.exception() is not None):
+            failed_rooms.append(room_future)
+
+    with ThreadPoolExecutor(max_workers=ROOM_WORKERS, thread_name_prefix='Room') as executor:
+        try:
+            # Loop throught the list of rooms and treat each room separately
+            num_of_rooms = 0
+            rooms_users = {}
+
+            for j_room in jabber_rooms:
+                # A room that already failed ends the migration, before handing more rooms to the workers
+                if(len(failed_rooms) > 0):
+                    failed_rooms[0].result()
+
+                num_of_rooms += 1
+
+                # Storing room details in variables: room_id, room_title, room_subject
+                j_room_id = j_room[0]
+                j_room_title = ''
+
+                # Jabber Users #
+                # Execute a single query to get the users of the next batch of DB_ROOM_BATCH_SIZE rooms, grouped by room
+                if(j_room_id not in rooms_users):
+                    rooms_batch = jabber_rooms[num_of_rooms - 1:num_of_rooms - 1 + DB_ROOM_BATCH_SIZE]
+                    rooms_users = jabber_db_get_rooms_users(conn, [room[0] for room in rooms_batch])
+
+                # Get the room title/name from config xml result from DB
+                j_room_title = xml_get_jabber_room_title(j_room[1])
+
+                # When resuming, rooms fully migrated by the interrupted run are skipped,
+                # and rooms it already created in Webex are continued without checking their titles again
+                room_progress = journal["rooms"].get(j_room_id)
+                if(room_progress is not None and room_progress["webex_room"] is None):
+                    room_progress = None
+                if(room_progress is not None and room_progress["completed"]):
+                    logging.info('Room-' + str(num_of_rooms) + ': \"' + j_room_title + '\" was already migrated. Skipping it..')
+                    write_summary_record({"jabber_room": j_room_id, "webex_room": room_progress["webex_room"],
+                                          "room_users": room_progress["room_users"]})
+                    continue
+
+                # If the user wanted to check Webex exisiting rooms' titles.
+                # This is done here, before handing the room to a worker, as it may need the user's input
+                if(CREATE_WEBEX_ROOMS and CHECK_WEBEX_EXISTING_ROOMS and room_progress is None):
+                    room_matched = False
                     # Once a room with the same title is found in Webex, it will be skipped
-                    if(w_title == j_room_title):
+                    if(webex_room_title_key(j_room_title) in webex_titles):
                         logging.info('A room with the title: \"' + j_room_title + '\" already exists in Webex!)')
                         room_matched = True
-                        break
-                # Hanlding the matched room title, 'continue' will skip a loop iteration and check the next room
-                if(room_matched):
-                    invalid_choice = True
-                    skip_room = False
-                    while(invalid_choice):
-                        choice = input('Do you want to migrate it? [Enter M] (new room will be created on Webex)\nor skip it? [Enter S]\n')
-                        if choice in ['m','M']:
-                            logging.info('Migrating this room ...')
-                            invalid_choice = False
-                        elif choice  in ['s','S']:
-                            logging.info('Skipping this room')
-                            invalid_choice = False
-                            skip_room = True
-                        else:
-                            logging.info('Incorrect choice,, please check your input')
-                    if(skip_room):
-                        continue
-                        
-            # Resetting the list of users
-            webex_room_users = []
-            w_room_id = webex_api_create_room(j_room_title)
-        # Boolean to choose if the archiver user needs to leave the room after everything
-        # Changed to False after creating a seprate script to leave all the rooms (leave_webex_rooms.py)
-        # Change to True to make the user leave directly after creating it and adding users & messages
-        leave_room = False
-
-        # Jabber Users #
-        # Execute a query to get list of users in the current room
-        jabber_room_users = conn.execute(
-            "SELECT real_jid, affiliation FROM tc_users WHERE role!='moderator' AND room_jid='" + j_room_id +"'"
-        )
-        logging.info('Users:')
-        num_of_users = 0
-        for j_user in jabber_room_users:
-            num_of_users += 1
-            j_user_id = str(j_user[0])
-            j_user_affiliation = str(j_user[1])
-            if '/' in j_user_id:
-                j_user_id = j_user_id.split('/')
-                j_user_id = j_user_id[0]
-            
-            logging.info('\t' + str(num_of_users) + '- ' + j_user_id +
-                  '\taffiliation: ' + j_user_affiliation)
-        
-            # Boolean variable 'isModerator' to be used in Webex API matching the role/affiliation in Jabber
-            w_user_moderator = "false"
-            if (j_user_affiliation == "admin" or j_user_affiliation == "owner"):
-                w_user_moderator = "true"
-
-            if INCLUDE_JABBER_WEBEX_MAP:
-                j_user_id = map_dict[j_user_id]
-            else:
-                # This step is only needed if the domain of Jabber IM is different than Webex environment
-                j_user_id = j_user_id.replace(JABBER_DOMAIN, WEBEX_DOMAIN)
-
-            # Checking if the archiving user in Webex was already a user in the room in Jabber
-            if(CREATE_WEBEX_ROOMS):
-                if (j_user_id == archiver_info["email"]):
-                    leave_room = False
-
-            # Webex API  - Adding Users to the Room #
-            # Add the users in the newly created Webex room
-            if(CREATE_WEBEX_ROOMS):
-                webex_api_add_user_to_room(w_room_id, j_user_id, w_user_moderator)
-                print("adding user " + j_user_id + " to a room")
-
-        # Jabber Messages #
-        # Execute a query to read messages details in the room from tc_msgarchive table
-        jabber_messages = conn.execute(
-            "SELECT sent_date, from_jid, body_string, message_string FROM tc_msgarchive where to_jid = '" + j_room_id + "'")
-
-        # Printing the list of messaages in the room
-        logging.info('Messages:')
-        num_of_msgs = 0
-        for j_msg in jabber_messages:
-            num_of_msgs += 1
-            j_msg_sent_date = str(j_msg[0])
-            j_msg_sender_id = str(j_msg[1])
-            j_msg_body = str(j_msg[2])
-            j_msg_full_string = str(j_msg[3])
+                    # Hanlding the matched room title, 'continue' will skip a loop iteration and check the next room
+                    if(room_matched):
+                        invalid_choice = True
+                        skip_room = False
+                        while(invalid_choice):
+                            choice = input('Do you want to migrate it? [Enter M] (new room will be created on Webex)\nor skip it? [Enter S]\n')
+                            if choice in ['m','M']:
+                                logging.info('Migrating this room ...')
+                                invalid_choice = False
+                            elif choice  in ['s','S']:
+                                logging.info('Skipping this room')
+                                invalid_choice = False
+                                skip_room = True
+                            else:
+                                logging.info('Incorrect choice,, please check your input')
+                        if(skip_room):
+                            continue
+
+                room_future = executor.submit(
+                    migrate_room, num_of_rooms, j_room_id, j_room_title, rooms_users[j_room_id], archiver_info, room_progress)
+                room_future.add_done_callback(check_room_failure)
+                room_futures.append(room_future)
+
+            # Waiting for the rooms to be migrated, until the first one that fails. Each room recorded its webex generated data to the summary once migrated
+            done_rooms, _ = wait(room_futures, return_when=FIRST_EXCEPTION)
+            for room_future in done_rooms:
+                room_future.result()
+        except BaseException:
+            # Stop the rooms that didn't start yet, as soon as a room failed or the script is being ended
+            for room_future in room_futures:
+                room_future.cancel()
+            raise
 
-            logging.info('\t' + str(num_of_msgs) + '- sent_date: ' +
-                  j_msg_sent_date + '\t from_jid: ' + j_msg_sender_id + '\n\t\tbody_string: ' + j_msg_body)
+    # Closing all connections
+    conn.close()
+    close_webex_session()
+    close_migration_journal()
+    close_webex_summary()
+    if(INCLUDE_FILE_TRANSFER):
+        close_file_servers()
+        log_file_server_stats()
+        clear_attachment_cache()
+
+    stop_metrics_writer()
+    logging.info("-"*25 + " Completed " + "-"*25)
+    stop_migration_logging()
+
+# argparse - Reading the command line options of the script
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Migrate Jabber persistent chat rooms to Webex')
+    parser.add_argument('--resume', metavar='JOURNAL_FILE_NAME',
+                        help='Migration journal (inside LOGS_FOLDER) of an interrupted run to resume: '
+                             'migrated rooms are skipped, and a partially migrated room continues after its last posted message')
+    parser.add_argument('--shard', metavar='K/N', type=parse_shard,
+                        help='Only migrate the K-th of N shards of the rooms, to split the migration across N processes or hosts. '
+                             'Each room belongs to a single shard, by a stable hash of its room_jid')
+    return parser.parse_args()
+
+# argparse - Reading the '--shard K/N' option: returns (K, N), with 1 <= K <= N
+def parse_shard(value):
+    try:
+        shard_number, shard_count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected K/N, i.e: 1/4')
+    if(shard_count < 1 or shard_number < 1 or shard_number > shard_count):
+        raise argparse.ArgumentTypeError('expected K/N with 1 <= K <= N, i.e: 1/4')
+    return (shard_number, shard_count)
+
+# The shard of the run as recorded to its journal and summary: "K/N", or None when all the rooms are migrated
+def shard_text(shard):
+    if(shard is None):
+        return None
+    return str(shard[0]) + '/' + str(shard[1])
+
+# Migrating a single Jabber room: creating it in Webex, adding its users and posting its messages in order.
+# Each room gets its own DB connections and summary entry,
+# so rooms migrated in parallel don't share any state.
+# 'jabber_room_users' is the list of the room's users: (real_jid, affiliation), read with its batch of rooms.
+# 'room_progress' is the room's progress read from the journal, when resuming a room created by an interrupted run
+def migrate_room(room_number, j_room_id, j_room_title, jabber_room_users, archiver_info, room_progress=None):
+    room_start_time = time.monotonic()
+    # Connection to DB
+    conn_mft = None
+    try:
+        # Connect to persistance Chat DB
+        conn = tc_engine.connect()
+
+        # Connect to Managed File Transfer DB
+        if(INCLUDE_FILE_TRANSFER):
+            conn_mft = mft_engine.connect()
+    except:
+        logging.info(
+            'Error: Unable to connect to Jabber\'s external DBs for chat and file_transfer logs..')
+        exit()
+
+    logging.info('#'*25 + ' Room-' + str(room_number) + ' ' + '#'*25)
+    logging.info('Jabber Room ID: ' + j_room_id)
+
+    # Summary of the Webex generated data for this room
+    room_summary = None
 
-            if INCLUDE_JABBER_WEBEX_MAP:
-                j_msg_sender_id = map_dict[j_msg_sender_id]
+    # Users added & messages posted to Webex by the interrupted run, when resuming the room
+    users_added = set()
+    messages_posted = 0
+    last_msg_id = None
+
+    # Webex API  - Room Creation #
+    # Create a room in Webex matching Jabber room (Title)
+    if(CREATE_WEBEX_ROOMS):
+        if(room_progress is not None):
+            w_room_id = room_progress["webex_room"]["id"]
+            room_summary = {"jabber_room": j_room_id, "webex_room": room_progress["webex_room"], "room_users": list(room_progress["room_users"])}
+            users_added = set(user["email"] for user in room_progress["room_users"])
+            messages_posted = room_progress["messages_posted"]
+            last_msg_id = room_progress["last_msg_id"]
+            logging.info('Resuming Webex\'s Room with ID: ' + w_room_id + ', after message #' + str(messages_posted))
+        else:
+            w_room_id = webex_api_create_room(j_room_title)
+            room_summary = {"jabber_room": j_room_id, "webex_room": {"title": j_room_title, "id": w_room_id}, "room_users": []}
+            journal_record({"type": "room", "jabber_room": j_room_id, "webex_room": room_summary["webex_room"]})
+    # Boolean to choose if the archiver user needs to leave the room after everything
+    # Changed to False after creating a seprate script to leave all the rooms (leave_webex_rooms.py)
+    # Change to True to make the user leave directly after creating it and adding users & messages
+    leave_room = False
+
+    # Jabber Users #
+    logging.info('Users:')
+    num_of_users = 0
+    users_to_add = []
+    for j_user in jabber_room_users:
+        num_of_users += 1
+        j_user_id = str(j_user[0])
+        j_user_affiliation = str(j_user[1])
+        if '/' in j_user_id:
+            j_user_id = j_user_id.split('/')
+            j_user_id = j_user_id[0]
+
+        logging.info('\t' + str(num_of_users) + '- ' + j_user_id +
+              '\taffiliation: ' + j_user_affiliation)
+
+        # Boolean variable 'isModerator' to be used in Webex API matching the role/affiliation in Jabber
+        w_user_moderator = "false"
+        if (j_user_affiliation == "admin" or j_user_affiliation == "owner"):
+            w_user_moderator = "true"
+
+        # Getting the user's Webex email, from the user map or by replacing the Jabber domain
+        j_user_id = webex_user_email(j_user_id)
+
+        # Checking if the archiving user in Webex was already a user in the room in Jabber
+        if(CREATE_WEBEX_ROOMS):
+            if (j_user_id == archiver_info["email"]):
+                leave_room = False
+
+        # Skipping the users added already by the interrupted run
+        if(j_user_id not in users_added):
+            users_to_add.append((j_user_id, w_user_moderator))
+
+    # Webex API  - Adding Users to the Room #
+    # The room's memberships are listed once, and only the users who aren't members yet are added,
+    # by MEMBERSHIP_WORKERS concurrent calls under the shared rate limit. Users are recorded in their Jabber order
+    if(CREATE_WEBEX_ROOMS and len(users_to_add) > 0):
+        w_room_members = webex_api_get_room_members(w_room_id)
+        with ThreadPoolExecutor(max_workers=MEMBERSHIP_WORKERS, thread_name_prefix='Membership') as membership_executor:
+            membership_futures = []
+            for j_user_id, w_user_moderator in users_to_add:
+                w_member = w_room_members.get(j_user_id.lower())
+                if(w_member is not None):
+                    logging.info('\tUser: ' + j_user_id + ' is already a member of the room..')
+                    membership_futures.append({"user_already_exists":"true", "email":j_user_id, "idModerator":w_user_moderator,
+                                               "id":w_member["personId"], "membershipId":w_member["id"]})
+                else:
+                    membership_futures.append(membership_executor.submit(webex_api_add_user_to_room, w_room_id, j_user_id, w_user_moderator))
+
+            for membership in membership_futures:
+                json_user_details = membership
+                if(isinstance(membership, Future)):
+                    json_user_details = membership.result()
+                if(json_user_details is not None):
+                    room_summary["room_users"].append(json_user_details)
+                    journal_record({"type": "membership", "jabber_room": j_room_id, "user": json_user_details})
+
+    # Jabber Messages #
+    # Streaming the messages details in the room from tc_msgarchive table, page by page in chronological order.
+    # When resuming, the stream starts right after the last message posted by the interrupted run
+    jabber_messages = jabber_db_stream_room_messages(conn, j_room_id, last_msg_id)
+
+    # The messages go through a pipeline: they are read from the DB, transformed (XML & markdown), and their attachments downloaded
+    # by the stages' threads, ahead of the message being posted here to Webex. They come out of the pipeline in their original order
+    room_messages = {"j_room_id": j_room_id, "conn_mft": conn_mft, "aft_log_index": None, "aft_log_lock": threading.Lock()}
+    stages = [("Transform", lambda j_msg: transform_message(j_msg, room_messages), PIPELINE_TRANSFORM_WORKERS)]
+    if(INCLUDE_FILE_TRANSFER and not ATTACHMENT_STREAMING):
+        stages.append(("Fetch", fetch_message_attachment, FILE_DOWNLOAD_WORKERS))
+    messages_pipeline = run_pipeline(jabber_messages, stages, PIPELINE_MAX_IN_FLIGHT, name='Room-' + str(room_number))
+
+    # Printing the list of messaages in the room
+    logging.info('Messages:')
+    num_of_msgs = 0
+    num_of_attachments = 0
+    if(last_msg_id is not None):
+        num_of_msgs = messages_posted
+
+    # With COALESCE_MESSAGES, consecutive text messages are packed into a single Webex message,
+    # and recorded to the journal once that message is posted
+    coalescer = None
+    if(CREATE_WEBEX_ROOMS and COALESCE_MESSAGES):
+        def journal_records(msg_records):
+            for msg_record in msg_records:
+                journal_record(msg_record)
+        coalescer = MessageCoalescer(lambda msg_txt_content: stop_unless_posted(
+            webex_api_post_message_to_room(w_room_id, msg_txt_content), j_room_id), journal_records)
+    # The pipeline's threads and the room's connections are closed however the room ends, i.e: when a message couldn't be posted
+    try:
+        for message in messages_pipeline:
+            num_of_msgs += 1
+            # Skipping the messages posted already by the interrupted run, if its journal didn't record their msg_id
+            if(num_of_msgs <= messages_posted):
+                continue
+            j_msg_sent_date = message["sent_date"]
+            j_msg_sender_id = message["sender"]
+            j_attachment = message["attachment"]
+
+            message_log.info('\t%s- sent_date: %s\t from_jid: %s\n\t\tbody_string: %s', num_of_msgs, j_msg_sent_date, message["from_jid"],
+                             message["body"])
+
+            msg_record = {"type": "message", "jabber_room": j_room_id, "number": num_of_msgs, "msg_id": message["msg_id"], "sent_date": j_msg_sent_date}
+            msg_coalesced = False
+
+            # A text message: formatted with markdown by the pipeline, to show as an archived message
+            if(j_attachment is None):
+                # Webex API  - Creating the existing Jabber messages to the room #
+                # Create the list of Jabber messages in the newly created Webex room
+                if(coalescer is not None):
+                    coalescer.add(message["msg_txt_content"], j_msg_sent_date, msg_record)
+                    msg_coalesced = True
+                elif(CREATE_WEBEX_ROOMS):
+                    stop_unless_posted(webex_api_post_message_to_room(w_room_id, message["msg_txt_content"]), j_room_id)
+
+            # A message that has attachment/s, with file_transfer enabled.
+            # Its file_transfer record was found, and its file downloaded, ahead of posting it by the pipeline
             else:
-                # This step is only needed if the domain of Jabber IM is different than Webex environment
-                j_msg_sender_id = j_msg_sender_id.replace(
-                    JABBER_DOMAIN, WEBEX_DOMAIN)
-            
-
-            # Trim the send_date to show only down to seconds, and match the managed file transfer DB's timing format
-            j_msg_sent_date = j_msg_sent_date[0:19]
-
-            # Checking if file_transfer is enabled, to connect to Managed File Transfer DB and File_Server
-            if(INCLUDE_FILE_TRANSFER):
-                # Detecting a text message with no attachments
-                if (j_msg_body != 'Your chat application does not support downloading this file'):
-                    # Formatting message text content & look using markdown, to show as an archived message
-                    msg_txt_content = markdown_msg_text_for_webex(
-                        j_msg_sender_id, j_msg_sent_date, j_msg_body)
-
-                    # Webex API  - Creating the existing Jabber messages to the room #
-                    # Create the list of Jabber messages in the newly created Webex room
+                num_of_attachments += 1
+                # The text messages packed before it are posted first, to keep the messages in order
+                if(coalescer is not None):
+                    coalescer.flush()
+                file_name = j_attachment["file_name"]
+                attachment_text = j_attachment["attachment_text"]
+                mft_file_details = j_attachment["file_details"]
+
+                # After trying the time range for records and still not finding any results, skipping the message
+                if(mft_file_details is None):
+                    logging.info('No records for any file_transfer at: %s or +/-%s around it', j_msg_sent_date, AFT_TIME_TOLERANCE)
+
+                    # Skip the message and just post a notification about it
                     if(CREATE_WEBEX_ROOMS):
-                        webex_api_post_message_to_room(w_room_id, msg_txt_content)
+                        stop_unless_posted(post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text,
+                                                                         'Transfer record not found..'), j_room_id)
 
-                # A message that has attachment/s
+                # File found, save it to the temp folder, then forward it to Webex as an attachment
                 else:
-                    logging.info('\tAttachment found! Getting file_Transfer details:')
-
-                    # Parsing the xml result to get the file details from the DB field: message_string
-                    file_name = xml_get_jabber_attachment_file_name(
-                        j_msg_full_string)
-                    attachment_text = xml_get_jabber_attachment_text(
-                        j_msg_full_string)
-                    file_server = ''
-                    file_remote_path = ''
-
-                    # Getting file details from the Managed File Transfer db, aft_log table. Matching:
-                    # 1- The destiantion room, 2- The time of the message (up to the second), and 3- the file_name matching real_file_name
-                    mft_file_details = conn_mft.execute("SELECT file_server, file_path, bytes_transferred FROM aft_log where method = 'Post' AND to_jid = '" +
-                                                        j_room_id + "' AND timestampvalue = '" + j_msg_sent_date + "' AND real_filename = '" + file_name + "'")
-
-                    mft_file_details = mft_file_details.fetchone()
-
-                    # If there is no records on File_transfer_DB with the exact timestamp (down to the second),
-                    # try to find the record with the same file name and destination room but close to its timestamp (Rounding up to x seconds)
-                    if(mft_file_details is None):
-                        logging.info('\tNo records for any file_transfer at: ' +
-                            j_msg_sent_date)
-
-                        # Finding the closest record to it in a +/-3 seconds range
+                    file_server = str(mft_file_details[0])
+                    file_remote_path = str(mft_file_details[1])
+                    file_size = mft_file_details[2]
+                    message_log.info('Attachment location:\n\t\tServer: %s\n\t\tRemote path: %s', file_server, file_remote_path)
+                    message_log.info('\t\tFile Size in bytes: %s', file_size)
+
+                    # Checking if attachment size in not above the limit of Webex attachments of 100MB
+                    if(file_size >= WEBEX_MAX_FILE_SIZE):
                         logging.info(
-                            '\tTrying to find the closest record with down to -3 seconds to it:')
-                        x = 1
-                        while((mft_file_details is None) and x <= 3):
-                            msg_time_variable = datetime.datetime.strptime(
-                                j_msg_sent_date, '%Y-%m-%d %H:%M:%S')
-                            # Substract x seconds then check if the record was found
-                            msg_time_variable = msg_time_variable + \
-                                datetime.timedelta(seconds=-x)
-                            logging.info('\tSearching for: ' + str(msg_time_variable))
-                            mft_file_details = conn_mft.execute("SELECT file_server, file_path FROM aft_log where method = 'Post' AND to_jid = '" +
-                                                                j_room_id + "' AND timestampvalue = '" + str(msg_time_variable) + "' AND real_filename = '" + file_name + "'")
-                            mft_file_details = mft_file_details.fetchone()
-                            # Attachment record found
-                            if(mft_file_details is not None):
-                                logging.info('\tRecord found! Forwarding the attachment..')
-                            x += 1
-                        # Reset the seconds, to go over search for x seconds up
-                        x = 1
-                        if(mft_file_details is None):
-                            logging.info(
-                                '\tNo recored. Trying to find the closest record with up to +3 seconds to it:')
-                            while((mft_file_details is None) and x <= 3):
-                                msg_time_variable = datetime.datetime.strptime(
-                                    j_msg_sent_date, '%Y-%m-%d %H:%M:%S')
-                                # Add x seconds then check if the record was found
-                                msg_time_variable = msg_time_variable + \
-                                    datetime.timedelta(seconds=x)
-                                logging.info('\tSearching for: ' + str(msg_time_variable))
-                                mft_file_details = conn_mft.execute("SELECT file_server, file_path FROM aft_log where method = 'Post' AND to_jid = '" +
-                                                                    j_room_id + "' AND timestampvalue = '" + str(msg_time_variable) + "' AND real_filename = '" + file_name + "'")
-                                mft_file_details = mft_file_details.fetchone()
-                                # Attachment record found
-                                if(mft_file_details is not None):
-                                    logging.info('\tRecord found! Forwarding the attachment..')
-                                x += 1
-
-                    # After trying the time range for records and still not finding any results, skipping the message
-                    if(mft_file_details is None):
-                        logging.info('No records for any file_transfer at: ' +
-                            j_msg_sent_date + ' or +/-3 around it')
-
-                        # Skip the message and just post a notification about it
-                        logging.info('\t\tPosting alert about the message to Webex:')
-                        msg_txt_content = "(Archived message with attachment. Error: Unable to load file: Transfer record not found..)\\n**From: <@personEmail:" + \
-                            j_msg_sender_id + ">**\\t```at: " + j_msg_sent_date + "```\\n" + attachment_text
+                            'File size is over the limit of Webex message attachments (100MB)')
                         if(CREATE_WEBEX_ROOMS):
-                            webex_api_post_message_to_room(w_room_id, msg_txt_content)
+                            stop_unless_posted(post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text,
+                                                                             'File size is too big..'), j_room_id)
 
-                    # File found, save it to the temp folder, then forward it to Webex as an attachment
-                    else:
-                        file_server = str(mft_file_details[0])
-                        file_remote_path = str(mft_file_details[1])
-                        file_size = mft_file_details[2]
-                        logging.info('Attachment location:\n\t\tServer: ' +
-                            file_server + '\n\t\tRemote path: ' + file_remote_path)
-                        logging.info('\t\tFile Size in bytes: ' + str(file_size))
-
-                        # Checking if attachment size in not above the limit of Webex attachments of 100MB
-                        if(file_size >= 100000000):
-                            logging.info(
-                                'File size is over the limit of Webex message attachments (100MB)')
-                            logging.info('\t\tPosting alert about the message to Webex:')
-                            msg_txt_content = "(Archived message with attachment. Error: Unable to load file: File size is too big..)\\n**From: <@personEmail:" + \
-                                j_msg_sender_id + ">**\\t```at: " + j_msg_sent_date + "```\\n" + attachment_text
-                            if(CREATE_WEBEX_ROOMS):
-                                webex_api_post_message_to_room(w_room_id, msg_txt_content)
+                    # Streaming the file from the file_server straight into the Webex message with attachment
+                    elif(ATTACHMENT_STREAMING):
+                        if(CREATE_WEBEX_ROOMS):
+                            try:
+                                post_result = stop_unless_posted(sftp_stream_upload(
+                                    file_server, file_remote_path, lambda open_attachment: webex_api_post_msg_with_attachment_to_room(
+                                        w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, file_name, open_attachment)), j_room_id)
+                                error = 'Upload failed..'
+                            except Exception:
+                                logging.info('\t\tError: Unable to stream the file from: ' + file_server)
+                                post_result = "rejected"
+                                error = 'Download failed..'
+                            if(post_result == "rejected"):
+                                stop_unless_posted(post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, error),
+                                                   j_room_id)
 
+                    else:
+                        # The file was saved to the local_folder by the pipeline's Fetch stage
+                        if(j_attachment["downloaded"]):
+                            message_log.info('\t\tFile downloaded..')
                         else:
-                            # Save the file to a local_folder, then attach it in to Webex API call to create_message with attachment
-                            logging.info('\t\tDownloading to: ' +
-                                LOCAL_FILE_TRANSFER_FOLDER + file_name)
-                            check_local_folder(LOCAL_FILE_TRANSFER_FOLDER)
-
-                            # Check that the file_Server is matching the already connected ssh_client, otherwise reconnect to the newly found host
-                            if (file_server == current_connection):
-                                ftp_client.get(file_remote_path,
-                                            (LOCAL_FILE_TRANSFER_FOLDER+file_name))
-                                logging.info('\t\tFile downloaded..')
-                            else:
-                                logging.info(
-                                    '\t\tFile_server found is different than current connection.. Switching the connection to: ' + file_server)
-                                ftp_client = connect_to_file_server(file_server)
-                                current_connection = file_server
-                                ftp_client.get(file_remote_path,
-                                            (LOCAL_FILE_TRANSFER_FOLDER+file_name))
-                                logging.info('\t\tFile downloaded..')
-
-                            # Webex API - Posting the message with attachments to the Webex room
-                            if(CREATE_WEBEX_ROOMS):
-                                webex_api_post_msg_with_attachment_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, (LOCAL_FILE_TRANSFER_FOLDER+file_name))
-
-            # INCLUDE_FILE_TRANSFER is False,, just read text messages as they are
-            else:
-                # Formatting message text content & look using markdown, to show as an archived message
-                    msg_txt_content = markdown_msg_text_for_webex(
-                        j_msg_sender_id, j_msg_sent_date, j_msg_body)
-
-                    # Webex API  - Creating the existing Jabber messages to the room #
-                    # Create the list of Jabber messages in the newly created Webex room
-                    if(CREATE_WEBEX_ROOMS):
-                        webex_api_post_message_to_room(w_room_id, msg_txt_content)
-
-        # After creating the room, adding the users, & posting the messages: record the room info & leave the room
-        if(CREATE_WEBEX_ROOMS):
-            # Recording webex generated data
-            webex_room_dict["room_users"] = webex_room_users
-            webex_json_data.append(webex_room_dict)
-            # Leave the room if not originally part of it
-            if(leave_room):
-                webex_api_leave_room(w_room_id, archiver_info["id"])
-    
-    # Closing all connections
-    conn.close()
-    if(INCLUDE_FILE_TRANSFER):
-        conn_mft.close()
-        ftp_client.close()
-
-    logging.info("-"*25 + " Completed " + "-"*25)
+                            logging.info('\t\tError: Unable to download the file from: ' + file_server)
+
+                        # Webex API - Posting the message with attachments to the Webex room
+                        try:
+                            if(CREATE_WEBEX_ROOMS and j_attachment["downloaded"]):
+                                local_path = j_attachment["local_path"]
+                                post_result = stop_unless_posted(webex_api_post_msg_with_attachment_to_room(
+                                    w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, file_name, lambda: open(local_path, 'rb')), j_room_id)
+                                if(post_result == "rejected"):
+                                    stop_unless_posted(post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text,
+                                                                                     'Upload failed..'), j_room_id)
+                            elif(CREATE_WEBEX_ROOMS):
+                                stop_unless_posted(post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text,
+                                                                                 'Download failed..'), j_room_id)
+                        finally:
+                            # The local file is deleted, or kept in the attachment cache for the next messages with the same attachment
+                            release_attachment(j_attachment["cached"])
+
+            count("migration_messages_total")
+
+            # Recording the message to the journal, once posted to Webex (packed messages are recorded once their Webex message is posted).
+            # A message that couldn't be posted stopped the room before this point, so it's not recorded and a resumed run posts it again
+            if(CREATE_WEBEX_ROOMS and not msg_coalesced):
+                journal_record(msg_record)
+
+        # Posting the last packed text messages of the room
+        if(coalescer is not None):
+            coalescer.flush()
+    finally:
+        # Stopping the pipeline's threads, and closing the room's connections
+        messages_pipeline.close()
+        conn.close()
+        if(conn_mft is not None):
+            conn_mft.close()
+
+    # After creating the room, adding the users, & posting the messages: leave the room if not originally part of it
+    if(CREATE_WEBEX_ROOMS and leave_room):
+        webex_api_leave_room(w_room_id, archiver_info["id"])
     if(CREATE_WEBEX_ROOMS):
-        webex_json_summary.info((json.dumps(webex_json_data, indent=4)))
+        journal_record({"type": "room_completed", "jabber_room": j_room_id})
+        write_summary_record(room_summary)
+
+    # Summary of the room, written even when the details of each message are not (LOG_MESSAGE_DETAILS)
+    count("migration_rooms_total")
+    room_seconds = round(time.monotonic() - room_start_time, 2)
+    messages_per_second = round((num_of_msgs - messages_posted) / room_seconds, 2) if room_seconds > 0 else 0
+    logging.info('Room-%s completed: %s users, %s messages (%s with attachment) in %s seconds (%s messages/s)', room_number, num_of_users,
+                 num_of_msgs, num_of_attachments, room_seconds, messages_per_second,
+                 extra={"data": {"jabber_room": j_room_id, "users": num_of_users, "messages": num_of_msgs, "attachments": num_of_attachments,
+                                 "seconds": room_seconds, "messages_per_second": messages_per_second}})
+
+# Pipeline's Transform stage - Preparing a message read from the DB to be posted: getting its sender's Webex email,
+# and formatting its text with markdown, or for a message with attachment (with file_transfer enabled):
+# parsing its XML and finding its file_transfer record. 'room_messages' has the room's details shared by the stage's threads
+def transform_message(j_msg, room_messages):
+    j_msg_body = str(j_msg[2])
+    message = {"msg_id": j_msg[4], "from_jid": str(j_msg[1]), "body": j_msg_body,
+               # Getting the sender's Webex email, from the user map or by replacing the Jabber domain
+               "sender": webex_user_email(str(j_msg[1])),
+               # Trim the send_date to show only down to seconds, and match the managed file transfer DB's timing format
+               "sent_date": str(j_msg[0])[0:19],
+               "msg_txt_content": None, "attachment": None}
+
+    # Checking if file_transfer is enabled, and detecting a message with attachment
+    if(INCLUDE_FILE_TRANSFER and j_msg_body == ATTACHMENT_MSG_BODY):
+        message_log.info('\tAttachment found! Getting file_Transfer details:')
+
+        # Parsing the xml result once to get the file details from the DB field: message_string
+        j_attachment = xml_get_jabber_attachment(str(j_msg[3]))
+        j_attachment.update({"file_details": None, "local_path": None, "downloaded": False, "cached": None,
+                             "local_file_name": str(j_msg[4]) + '_' + j_attachment["file_name"]})
+
+        # Getting file details from the Managed File Transfer db, aft_log table. Matching:
+        # 1- The destiantion room, 2- The time of the message (up to the second), and 3- the file_name matching real_file_name.
+        # The room's aft_log records are read once, on its first attachment, then searched in memory.
+        # If there is no record with the exact timestamp, the closest one within +/-AFT_TIME_TOLERANCE seconds is used
+        with room_messages["aft_log_lock"]:
+            if(room_messages["aft_log_index"] is None):
+                room_messages["aft_log_index"] = jabber_db_get_aft_log_index(room_messages["conn_mft"], room_messages["j_room_id"])
+        j_attachment["file_details"] = aft_log_find_record(room_messages["aft_log_index"], room_messages["j_room_id"], j_attachment["file_name"],
+                                                           message["sent_date"], AFT_TIME_TOLERANCE)
+        if(j_attachment["file_details"] is not None):
+            message_log.info('\tRecord found! Forwarding the attachment..')
+        message["attachment"] = j_attachment
+    else:
+        # Formatting message text content & look using markdown, to show as an archived message
+        message["msg_txt_content"] = markdown_msg_text_for_webex(message["sender"], message["sent_date"], j_msg_body)
+    return message
+
+# Pipeline's Fetch stage - Downloading the attachment of a message to the local_folder, unless it's above the limit of Webex attachments.
+# The local file name starts with the message ID, to keep attachments with the same name apart.
+# An attachment already in the attachment cache (ATTACHMENT_CACHE_MAX_BYTES) is not downloaded again
+def fetch_message_attachment(message):
+    j_attachment = message["attachment"]
+    if(j_attachment is None or j_attachment["file_details"] is None or j_attachment["file_details"][2] >= WEBEX_MAX_FILE_SIZE):
+        return message
+    mft_file_details = j_attachment["file_details"]
+    check_local_folder(LOCAL_FILE_TRANSFER_FOLDER)
+    j_attachment["cached"] = fetch_attachment(str(mft_file_details[0]), str(mft_file_details[1]), mft_file_details[2],
+                                              LOCAL_FILE_TRANSFER_FOLDER + j_attachment["local_file_name"])
+    j_attachment["local_path"] = j_attachment["cached"]["local_path"]
+    # Waiting for the file to be saved to the local_folder by the download workers
+    try:
+        j_attachment["cached"]["download"].result()
+        j_attachment["downloaded"] = True
+    except Exception:
+        j_attachment["downloaded"] = False
+    return message
 
 # pathlib - Check if the given folder exists, otherwise create it
 def check_local_folder(folder_path):
@@ -430,89 +667,40 @@ def check_local_folder(folder_path):
         logging.info('Error: Unable to create the folder to transfer files..')
         exit()
 
-# paramiko - Create an ftp_connection to a remote file server. To be able to get/put files from/to it.
-def connect_to_file_server(file_server):
-    try:
-        # Connect to the file_server using SSH
-        ssh_client = paramiko.SSHClient()
-        # Policy for automatically adding the hostname and new host key to the local HostKeys object, and saving it
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(file_server, username=FILE_SERVER_USER,
-                           password=FILE_SERVER_PASSWORD)
-        logging.info('Completed connection to Managed File Transfer Server: ' + file_server)
-
-        # Using SFTP client for file transfer of message attachments
-        ftp_client = ssh_client.open_sftp()
-        return ftp_client
-    except:
-        logging.info('Error: Unable to connect to Jabber\'s external file_transfer: ' +
-              file_server + ' to retrieve message attachments..')
-        exit()
-
 # Webex API - Getting user details: ID & emails. Using People APIs
 def webex_api_get_archiver_details():
     try:
         archiver_info = {"id": "", "email": ""}
-        url = "https://webexapis.com/v1/people/me"
+        endpoint = "people/me"
         payload = {}
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = webex_api_request("GET", endpoint, data=payload)
         res_dict = json.loads(response.text)
         archiver_info["id"] = res_dict["id"]
         archiver_info["email"] = res_dict["emails"][0]
         logging.info("Archiver_email: " + archiver_info["email"])
-        json_element = {"archiver_user":archiver_info}
-        webex_json_data.append(json_element)
         return archiver_info
     except:
         logging.info('Error getting Webex\'s archiver user details..')
         exit()
 
-# Webex API - Getting existing rooms' titles details as a list. Using Rooms APIs
-def webex_api_get_existing_rooms():
-    w_rooms_titles = []
-    # List the existing webex rooms
-    logging.info('-' * 5 + ' Calling Webex API to list the existing rooms: ' + '*'*10)
-    url = "https://webexapis.com/v1/rooms"
-    payload = {}
-    headers = {
-        'Authorization': WEBEX_AUTH
-    }
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print("\tResponse Code:" + str(response.status_code) +
-        ' (' + response.reason + ')')
-
-    res_dict = json.loads(response.text)
-    webex_rooms = res_dict["items"]
-    logging.info('\nWebex existing rooms:')
-    i = 0
-    for w_room in webex_rooms:
-        w_room_title = w_room["title"]
-        w_room_type = w_room["type"]
-        if(w_room_type == 'group'):
-            i += 1
-            logging.info(str(i) + '- \tType: ' + w_room_type + '\tTitle: ' + w_room_title)
-            w_rooms_titles.append(w_room_title)
-    return w_rooms_titles
+# Webex API - Getting the existing rooms of the archiver user, indexed by title: {title key: [room_id, ...]}. Using Rooms APIs
+def webex_api_get_existing_rooms(archiver_info):
+    try:
+        return webex_get_rooms_index(archiver_info["email"])
+    except Exception:
+        logging.info('Error listing the existing Webex rooms..')
+        exit()
 
 # Webex API - Creating a new room with a given title. Using Rooms APIs
 def webex_api_create_room(room_title):
-    global webex_json_data
-    global webex_room_dict
-    global webex_room_users
     try:
         logging.info('-' * 5 + ' Calling Webex API to create Room: ' +
               room_title)
-        url = "https://webexapis.com/v1/rooms"
+        endpoint = "rooms"
         payload = {
             "title": room_title
         }
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = webex_api_request("POST", endpoint, data=payload)
         logging.info("\tResponse Code:" + str(response.status_code) +
               ' (' + response.reason + ')')
 
@@ -521,14 +709,6 @@ def webex_api_create_room(room_title):
             logging.info(
                 'Webex authentication credentials are missing or incorrect..')
             exit()
-        while(response.status_code == 429):
-            logging.info('Too many requests have been sent in a given amount of time...')
-            res_dict = json.loads(response.text)
-            retry_after = res_dict["Retry-After"]
-            logging.info('Retrying after: ' + str(retry_after) + " seconds")
-            time.sleep(retry_after)
-            response = requests.request(
-                "POST", url, headers=headers, data=payload)
 
         # Saving the created Webex room_id
         res_dict = json.loads(response.text)
@@ -538,8 +718,6 @@ def webex_api_create_room(room_title):
         logging.info("Created Webex's Room with ID: " + w_room_id)
         logging.info("-"*30 + "\nCreated Webex's Room with ID: " + w_room_id)
         logging.info("\tTitle: " + room_title)
-        json_room_details = {"title":room_title,"id":w_room_id}
-        webex_room_dict = {"webex_room":json_room_details}
 
         return w_room_id
     except:
@@ -547,53 +725,59 @@ def webex_api_create_room(room_title):
         exit()
 
 # Webex API - Adding a new user to a room, with choosing if moderator or not. Using Memberships APIs
+# Returns the user details to be recorded in the room's summary
 def webex_api_add_user_to_room(room_id, user_email, is_moderator):
-    global webex_json_data
-    global webex_room_dict
-    global webex_room_users
+    json_user_details = None
     try:
         logging.info('-' * 5 + ' Calling Webex API to add the user: ' +
               user_email)
-        url = "https://webexapis.com/v1/memberships"
+        endpoint = "memberships"
         payload = "{\"isModerator\": \"" + is_moderator + "\",\"personEmail\": \"" + user_email + \
             "\",\"roomId\": \"" + room_id + "\"}"
         headers = {
-            'Authorization': WEBEX_AUTH,
             'Content-Type': 'application/json'
         }
-        response = requests.request(
-            "POST", url, headers=headers, data=payload)
+        response = webex_api_request(
+            "POST", endpoint, headers=headers, data=payload)
         logging.info("\tResponse Code: " + str(response.status_code) +
-              ' (' + response.reason + ')')
-        res_dict = json.loads(response.text)
-        if(response.status_code == 409):
-            logging.info('\tWarning: User already exists..')
-            json_user_details = {"user_already_exists":"true", "email":user_email, "idModerator":is_moderator}
-            webex_room_users.append(json_user_details)
-        else:
-            w_user_id = res_dict["personId"]
-
-            # Recording webex generated data
-            logging.info("\t\tAdded User with ID: " + w_user_id)
-            logging.info("\t\t\tEmail: " + user_email)
-            json_user_details = {"email":user_email, "idModerator":is_moderator, "id":w_user_id}
-            webex_room_users.append(json_user_details)
+              ' (' + response.reason + ') for: ' + user_email)
+    except Exception:
+        logging.info('Error adding user: ' + user_email + ' to the room..')
+        return None
 
-        # Handling failed requests
-        if(response.status_code == 401):
-            logging.info(
-                'Webex authentication credentials are missing or incorrect.\nEnding application...')
-            exit()
-        while(response.status_code == 429):
-            logging.info('Too many requests have been sent in a given amount of time...')
-            res_dict = json.loads(response.text)
-            retry_after = res_dict["Retry-After"]
-            logging.info('Retrying after: ' + str(retry_after) + " seconds")
-            time.sleep(retry_after)
-            response = requests.request(
-                "POST", url, headers=headers, data=payload)
-    except:
+    # Handling failed requests, before reading the response
+    if(response.status_code == 401):
+        logging.info(
+            'Webex authentication credentials are missing or incorrect.\nEnding application...')
+        exit()
+    if(response.status_code == 409):
+        logging.info('\tWarning: User already exists..')
+        json_user_details = {"user_already_exists":"true", "email":user_email, "idModerator":is_moderator}
+    elif(response.status_code == 200):
+        w_membership = json.loads(response.text)
+        w_user_id = w_membership["personId"]
+
+        # Recording webex generated data, with the membership ID so the rollback can delete it without looking it up
+        logging.info("\t\tAdded User with ID: " + w_user_id)
+        logging.info("\t\t\tEmail: " + user_email)
+        json_user_details = {"email":user_email, "idModerator":is_moderator, "id":w_user_id, "membershipId":w_membership["id"]}
+    else:
         logging.info('Error adding user: ' + user_email + ' to the room..')
+    return json_user_details
+
+# Webex API - Listing the members of a room, in pages of up to 1000 memberships. Using Memberships APIs.
+# Returns a dict of {lowercase email: membership}
+def webex_api_get_room_members(room_id):
+    logging.info('-' * 5 + ' Calling Webex API to list the members of the room')
+    w_room_members = {}
+    try:
+        for membership in webex_api_paginate("memberships", {"roomId": room_id}):
+            w_room_members[str(membership.get("personEmail", "")).lower()] = membership
+    except Exception:
+        # Without the list, all the users are added, and the existing ones are answered with 409
+        logging.info('Error listing the members of the room..')
+    logging.info('\tRoom members: ' + str(len(w_room_members)))
+    return w_room_members
 
 # Webex API - Deleting a user from a room. Won't be possible if the user is the only moderator. Using Memberships APIs
 def webex_api_leave_room(room_id, user_id):
@@ -601,15 +785,14 @@ def webex_api_leave_room(room_id, user_id):
 
         # Getting the membershipId for the archiver user in the room, to leave it if needed
         logging.info('-' * 5 + ' Calling Webex API to get membership Id of Archiver')
-        url = "https://webexapis.com/v1/memberships" + "?roomId=" + \
+        endpoint = "memberships" + "?roomId=" + \
             room_id + "&personId=" + user_id
         headers = {
-            'Authorization': WEBEX_AUTH,
             'Content-Type': 'application/json'
         }
         payload = {}
-        response = requests.request(
-            "GET", url, headers=headers, data=payload)
+        response = webex_api_request(
+            "GET", endpoint, headers=headers, data=payload)
         logging.info("\tResponse Code: " + str(response.status_code) +
               ' (' + response.reason + ')')
         res_dict = json.loads(response.text)
@@ -617,162 +800,113 @@ def webex_api_leave_room(room_id, user_id):
 
         # Leaving the room by calling DELETE membershipId
         logging.info('-' * 5 + ' Calling Webex API to delete archiver from the room')
-        url = "https://webexapis.com/v1/memberships" + "/" + membership_id
+        endpoint = "memberships" + "/" + membership_id
         payload = {}
-        response = requests.request(
-            "DELETE", url, headers=headers, data=payload)
+        response = webex_api_request(
+            "DELETE", endpoint, headers=headers, data=payload)
         logging.info("\tResponse Code: " + str(response.status_code) +
               ' (' + response.reason + ')')
         logging.info("%"*5 + " Archiver user leaving the room")
     except:
         logging.info('Error deleting user(archiver) from the room ..')
 
-# Webex API - Posting a message to a room. Using Messages APIs
+# Stopping the migration when a message couldn't be posted to Webex even after retrying it (WEBEX_MAX_RETRIES),
+# i.e: Webex or the network is down ('post_result' is "failed"), before the message is recorded to the journal.
+# The messages after it are not posted either, so resuming the run continues from the last message actually posted.
+# A message rejected by Webex ("rejected", i.e: 400) would be rejected again when resuming: it's logged, and the migration goes on
+def stop_unless_posted(post_result, j_room_id):
+    if(post_result == "failed"):
+        logging.info('Error: A message of the room: ' + j_room_id + ' couldn\'t be posted to Webex after ' + str(WEBEX_MAX_RETRIES) +
+                     ' retries. Ending application...\n'
+                     'Resume the migration from its journal with: python main.py --resume "<journal_file_name>"')
+        exit()
+    if(post_result == "rejected"):
+        count("migration_messages_rejected_total")
+    return post_result
+
+# Webex API - Posting a message to a room. Using Messages APIs.
+# Returns "posted", "rejected" (Webex answered with an error that retrying won't fix) or "failed" (server or connection errors, after the retries)
 def webex_api_post_message_to_room(room_id, msg_txt_content):
     try:
-        logging.info('-' * 5 + ' Calling Webex API to add the message to the room')
+        message_log.info('----- Calling Webex API to add the message to the room')
 
-        url = "https://webexapis.com/v1/messages"
+        endpoint = "messages"
         headers = {
-            'Authorization': WEBEX_AUTH,
             'Content-Type': 'application/json'
         }
         payload = "{\"roomId\": \"" + room_id + \
             "\", \"markdown\": \"" + msg_txt_content + "\"}"
-        response = requests.request(
-            "POST", url, headers=headers, data=payload)
-        logging.info("\tResponse Code: " + str(response.status_code) +
-              ' (' + response.reason + ')')
-
-        # Handling failed requests
-        if(response.status_code == 401):
-            logging.info(
-                'Webex authentication credentials are missing or incorrect.\nEnding application...')
-            exit()
-        while(response.status_code == 429):
-            logging.info(
-                'Too many requests have been sent in a given amount of time...')
-            res_dict = json.loads(response.text)
-            retry_after = res_dict["Retry-After"]
-            logging.info('Retrying after: ' + str(retry_after) + " seconds")
-            time.sleep(retry_after)
-            response = requests.request(
-                "POST", url, headers=headers, data=payload)
-    except:
-        logging.info('Error posting message: ' + msg_txt_content + ' to the room..')
+        response = webex_api_request(
+            "POST", endpoint, headers=headers, data=payload)
+        message_log.info('\tResponse Code: %s (%s)', response.status_code, response.reason)
+    except Exception:
+        logging.info('Error posting message: %s to the room..', msg_txt_content)
+        return "failed"
+
+    # Handling failed requests
+    if(response.status_code == 401):
+        logging.info(
+            'Webex authentication credentials are missing or incorrect.\nEnding application...')
+        exit()
+    if(response.status_code >= 400):
+        logging.info('Error posting message: %s to the room: %s (%s)', msg_txt_content, response.status_code, response.reason)
+        return webex_post_error_result(response)
+    return "posted"
 
-# Webex API - Posting a message with attachment to a room. Using Messages APIs
-def webex_api_post_msg_with_attachment_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, file_path):
-    logging.info('-' * 5 + ' Calling Webex API to add the message with attachment')
+# Webex API - Posting a message with attachment to a room, named file_name. Using Messages APIs.
+# 'open_attachment' opens the file to be uploaded: a local file, or a remote file streamed from the file_server.
+# It's called again if the upload is retried, as the file is read while being sent. Returns "posted", "rejected" or "failed"
+def webex_api_post_msg_with_attachment_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, file_name, open_attachment):
+    message_log.info('----- Calling Webex API to add the message with attachment')
 
     msg_txt_content = "(Archived message with attachment)\n**From: <@personEmail:" + \
         j_msg_sender_id + ">**\t```at: " + j_msg_sent_date + "```\n" + attachment_text
-    payload = MultipartEncoder({'roomId': w_room_id, 'markdown': msg_txt_content, 'files': (
-        file_path, open(file_path, 'rb'), 'application/octet-stream')})
-
-    url = "https://webexapis.com/v1/messages"
-    headers = {
-        'Authorization': WEBEX_AUTH,
-        'Content-Type': payload.content_type
-    }
-    response = requests.request(
-        "POST", url, headers=headers, data=payload)
-    logging.info("\tResponse Code: " + str(response.status_code) +
-          ' (' + response.reason + ')')
-
-# lxml - Parsing an XML string to get file name inside a advanced-file-transfer element
-def xml_get_jabber_attachment_file_name(msg_string_xml):
-    # Getting filename from a similar xml structure of:
-    '''
-    <message ... >
-        <advanced-file-transfer ... >
-            ...
-            <filename>result_here</filename>
-            ...
-        </advanced-file-transfer>
-    </message>
-    '''
-    xml_root = etree.fromstring(msg_string_xml)
 
-    # Going through the xml tree to find the <advanced-file-transfer> element to get: <filename> from it
-    aft_element = ''
-    for element in xml_root:
-        if('advanced-file-transfer' in element.tag):
-            aft_element = element
+    # requests_toolbelt is only loaded when the first attachment is posted
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
 
-    # From the XML tree, get the file_name and URL
-    for sub_element in aft_element:
-        if('filename' in str(sub_element.tag)):
-            file_name = str(sub_element.text)
-            logging.info('\t\tfile_name: ' + file_name)
+    endpoint = "messages"
+    opened_files = []
 
-    return file_name
+    def build_payload():
+        for attachment_file in opened_files:
+            attachment_file.close()
+        attachment_file = open_attachment()
+        opened_files.append(attachment_file)
+        payload = MultipartEncoder({'roomId': w_room_id, 'markdown': msg_txt_content, 'files': (
+            file_name, attachment_file, 'application/octet-stream')})
+        return {"data": payload, "headers": {'Content-Type': payload.content_type}}
 
-# lxml - Parsing an XML string to get a message that is written alongside an attachment file
-def xml_get_jabber_attachment_text(msg_string_xml):
-    # Getting a message that is written with an attachment file from a similar xml structure of:
-    '''
-    <message ... >
-        ...
-        <aft-html ... >
-            <body ... >
-                <span ... >
-                    <div>
-                        result_here
-                        <div ...>
-                        </div>
-                    </div>
-                </span>
-            </body>
-        </aft-html>
-    </message>
-    '''
-
-    xml_root = etree.fromstring(msg_string_xml)
-    attachment_text = ''
-
-    # Going through the xml tree to find the <aft-html> element to get the text sent with the attachment
-    aft_html_element = ''
-    for element in xml_root:
-        if('aft-html' in element.tag):
-            aft_html_element = element
-
-    # From the XML tree, get the text included with attachements; if it exists
-    for body_element in aft_html_element:
-        if('body' in str(body_element.tag)):
-            for span_element in body_element:
-                if('span' in str(span_element.tag)):
-                    for div_element in span_element:
-                        attachment_text = " ".join(
-                            t for t in div_element.xpath("text()"))
-                        logging.info('\t\tText with the attachment: ' +
-                              attachment_text)
-
-    return attachment_text
-
-# lxml - Parsing the output of Jabber room's config' field, and getting the Room Name/Title
-def xml_get_jabber_room_title(config_xml):
-    # Getting Room name from a similar xml structure of:
-    '''
-    <x ... >
-        <field ...>
-            <value>...</value>
-        <field ... var='muc#roomconfig_roomname'>
-            <value>result_here</value>
-        <field>
-    </x>
-    '''
-    xml_root = etree.fromstring(config_xml)
-
-    # Get the room name/title from the XML output of 'config' field which is the value of the third element:
-    # i.e: ... <field type='text-single' var='muc#roomconfig_roomname'><value>ROOM_NAME</value> ...
-    for element in xml_root:
-        if('\'muc#roomconfig_roomname\'' in str(element.attrib)):
-            for sub_element in element:
-                j_room_title = str(sub_element.text)
-
-    logging.info('Jabber Room Title: ' + j_room_title)
-    return j_room_title
+    try:
+        response = webex_api_request("POST", endpoint, payload_builder=build_payload)
+    except requests.RequestException:
+        logging.info('Error posting the attachment: %s to the room..', file_name)
+        return "failed"
+    finally:
+        for attachment_file in opened_files:
+            attachment_file.close()
+    message_log.info('\tResponse Code: %s (%s)', response.status_code, response.reason)
+    if(response.status_code == 401):
+        logging.info('Webex authentication credentials are missing or incorrect.\nEnding application...')
+        exit()
+    if(response.status_code >= 400):
+        logging.info('Error posting the attachment: %s to the room: %s (%s)', file_name, response.status_code, response.reason)
+        return webex_post_error_result(response)
+    return "posted"
+
+# Result of a message Webex answered with an error, once retried by webex_api_request: "failed" for server errors (5xx) and 429,
+# which may succeed later, "rejected" for the other errors (i.e: 400), which would be answered the same when resuming
+def webex_post_error_result(response):
+    if(response.status_code >= 500 or response.status_code == 429):
+        return "failed"
+    return "rejected"
+
+# Webex API - Posting an alert to the room, about a message whose attachment couldn't be loaded. Returns "posted", "rejected" or "failed"
+def post_attachment_error_to_room(w_room_id, j_msg_sender_id, j_msg_sent_date, attachment_text, error):
+    message_log.info('\t\tPosting alert about the message to Webex:')
+    msg_txt_content = "(Archived message with attachment. Error: Unable to load file: " + error + ")\\n**From: <@personEmail:" + \
+        j_msg_sender_id + ">**\\t```at: " + j_msg_sent_date + "```\\n" + attachment_text
+    return webex_api_post_message_to_room(w_room_id, msg_txt_content)
 
 # Python String Manipulation - Formatting the message to be sent to Webex to follow markdown markup language
 def markdown_msg_text_for_webex(msg_sender_id, msg_sent_date, msg_body):
@@ -801,4 +935,5 @@ def markdown_msg_text_for_webex(msg_sender_id, msg_sent_date, msg_body):
     return msg_txt_content
 
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import datetime
+from metrics import count
+
+from config import COALESCE_WINDOW
+
+# Size limit of the markdown of a Webex message, in bytes
+WEBEX_MAX_MARKDOWN_SIZE = 7439
+
+# First line of each archived message, written once at the top of the packed messages
+ARCHIVED_MSG_PREFIX = "(Archived message)\\n"
+ARCHIVED_MSGS_PREFIX = "(Archived messages)\\n"
+# Separator of the packed messages: an empty line (escaped as in the messages' markdown)
+PACKED_MSG_SEPARATOR = "\\n\\n"
+
+
+# Packing consecutive text messages of a room into a single archived Webex message, posted by 'post(msg_txt_content)'.
+# Each message keeps its own 'From: ... at: ...' header. The messages are posted once the next one doesn't fit in WEBEX_MAX_MARKDOWN_SIZE,
+# was sent outside COALESCE_WINDOW of the first one, or flush() is called (i.e: before a message with attachment, to keep their order).
+# 'on_posted(records)' is called with the records given to add() once their messages are posted, i.e: to write them to the journal
+class MessageCoalescer(object):
+    def __init__(self, post, on_posted, window=COALESCE_WINDOW, max_size=WEBEX_MAX_MARKDOWN_SIZE):
+        self.post = post
+        self.on_posted = on_posted
+        self.window = window
+        self.max_size = max_size
+        self.pending = []
+        self.records = []
+        self.pending_size = 0
+        self.first_sent_date = None
+
+    # Adding a formatted message (from markdown_msg_text_for_webex), sent at 'msg_sent_date' ('YYYY-MM-DD HH:MM:SS')
+    def add(self, msg_txt_content, msg_sent_date, record=None):
+        if(msg_txt_content.startswith(ARCHIVED_MSG_PREFIX)):
+            msg_txt_content = msg_txt_content[len(ARCHIVED_MSG_PREFIX):]
+        msg_size = len(msg_txt_content.encode('utf-8'))
+        if(len(self.pending) > 0 and (not self.in_window(msg_sent_date) or
+                                      self.pending_size + len(PACKED_MSG_SEPARATOR) + msg_size > self.max_size)):
+            self.flush()
+        if(len(self.pending) == 0):
+            self.first_sent_date = msg_sent_date
+            self.pending_size = len(ARCHIVED_MSGS_PREFIX)
+        else:
+            self.pending_size += len(PACKED_MSG_SEPARATOR)
+        self.pending.append(msg_txt_content)
+        self.records.append(record)
+        self.pending_size += msg_size
+
+    # Checking if a message was sent within COALESCE_WINDOW of the first packed message
+    def in_window(self, msg_sent_date):
+        if(self.window == 'day'):
+            return msg_sent_date[0:10] == self.first_sent_date[0:10]
+        first_sent = datetime.datetime.strptime(self.first_sent_date[0:19], '%Y-%m-%d %H:%M:%S')
+        sent = datetime.datetime.strptime(msg_sent_date[0:19], '%Y-%m-%d %H:%M:%S')
+        return sent - first_sent <= datetime.timedelta(minutes=float(self.window))
+
+    # Posting the packed messages, if any. A single message is posted as it was formatted
+    def flush(self):
+        if(len(self.pending) == 0):
+            return
+        if(len(self.pending) == 1):
+            self.post(ARCHIVED_MSG_PREFIX + self.pending[0])
+        else:
+            self.post(ARCHIVED_MSGS_PREFIX + PACKED_MSG_SEPARATOR.join(self.pending))
+            count("migration_coalesced_posts_total")
+            count("migration_coalesced_messages_total", value=len(self.pending))
+        records = self.records
+        self.pending = []
+        self.records = []
+        self.pending_size = 0
+        self.first_sent_date = None
+        self.on_posted(records)
@@ -0,0 +1,113 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import queue
+import threading
+
+# Seconds the pipeline threads wait on a queue or on the in-flight limit before checking if the pipeline was stopped
+PIPELINE_POLL_INTERVAL = 0.1
+
+
+# Running the items read from 'source' through a pipeline of stages, each one in its own threads, connected by bounded queues.
+# 'stages' is a list of (name, function, workers): each item is passed to 'function' by one of the stage's 'workers' threads,
+# and what it returns is passed to the next stage. The source is read by its own thread, so i.e: the next messages are read
+# from the DB and their attachments downloaded while the current message is posted by the caller.
+# Yields the results of the last stage in the order of the source, whatever order the stages finished them in.
+# At most 'max_in_flight' items are between the source and the caller at any time, so a slow caller holds the whole pipeline back.
+# An exception raised by the source or by a stage (i.e: exit()) stops the pipeline, and is raised again to the caller
+def run_pipeline(source, stages, max_in_flight, name='Pipeline'):
+    stop = threading.Event()
+    errors = []
+    in_flight = threading.Semaphore(max_in_flight)
+    stage_queues = [queue.Queue(maxsize=max_in_flight) for _ in range(len(stages))]
+    results = queue.Queue()
+    # Number of items read from the source, known once it's fully read
+    source_size = []
+
+    def put(target_queue, item):
+        while(not stop.is_set()):
+            try:
+                target_queue.put(item, timeout=PIPELINE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fail(error):
+        errors.append(error)
+        stop.set()
+        results.put(None)
+
+    def read_source():
+        try:
+            seq = 0
+            for item in source:
+                while(not in_flight.acquire(timeout=PIPELINE_POLL_INTERVAL)):
+                    if(stop.is_set()):
+                        return
+                if(not put(stage_queues[0] if len(stages) > 0 else results, (seq, item))):
+                    return
+                seq += 1
+            source_size.append(seq)
+            results.put(None)
+        except BaseException as error:
+            fail(error)
+
+    def run_stage(stage_number, function):
+        next_queue = stage_queues[stage_number + 1] if stage_number + 1 < len(stages) else results
+        while(not stop.is_set()):
+            try:
+                seq, item = stage_queues[stage_number].get(timeout=PIPELINE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            try:
+                result = function(item)
+            except BaseException as error:
+                fail(error)
+                return
+            put(next_queue, (seq, result))
+
+    threads = [threading.Thread(target=read_source, name=name + '-Reader', daemon=True)]
+    for stage_number, (stage_name, function, workers) in enumerate(stages):
+        for worker in range(max(1, workers)):
+            threads.append(threading.Thread(target=run_stage, args=(stage_number, function), daemon=True,
+                                            name=name + '-' + stage_name + '-' + str(worker + 1)))
+    for thread in threads:
+        thread.start()
+
+    try:
+        # Results finished ahead of their turn wait here, until the ones before them are done
+        finished = {}
+        next_seq = 0
+        while(True):
+            if(len(errors) > 0):
+                raise errors[0]
+            if(len(source_size) > 0 and next_seq >= source_size[0]):
+                return
+            result = results.get()
+            # None: the source was fully read, or the pipeline failed
+            if(result is None):
+                continue
+            seq, item = result
+            finished[seq] = item
+            while(next_seq in finished):
+                item = finished.pop(next_seq)
+                next_seq += 1
+                yield item
+                in_flight.release()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
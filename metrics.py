@@ -0,0 +1,181 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from config import LOGS_FOLDER, METRICS_FILE_NAME, METRICS_INTERVAL
+
+# Upper bounds, in seconds, of the latency histograms buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Description of each metric, written to the Prometheus text file
+METRICS_HELP = {
+    "migration_webex_request_seconds": ("histogram", "Latency of the Webex API calls, by class of endpoints and method"),
+    "migration_webex_responses_total": ("counter", "Webex API responses, by class of endpoints and status code"),
+    "migration_webex_retries_total": ("counter", "Webex API calls retried after a 429, a server error (5xx) or a connection error, by class of endpoints"),
+    "migration_webex_429_total": ("counter", "Webex API responses with 429 (Too Many Requests), by class of endpoints"),
+    "migration_db_query_seconds": ("histogram", "Latency of the Jabber DBs queries, by query"),
+    "migration_sftp_get_seconds": ("histogram", "Time to transfer a file from the file-transfer servers, by server and mode"),
+    "migration_sftp_bytes_total": ("counter", "Bytes transferred from the file-transfer servers, by server and mode"),
+    "migration_messages_total": ("counter", "Jabber messages migrated to Webex"),
+    "migration_messages_rejected_total": ("counter", "Messages rejected by Webex (i.e: 400), logged and skipped"),
+    "migration_coalesced_posts_total": ("counter", "Webex messages packing several Jabber text messages (COALESCE_MESSAGES)"),
+    "migration_coalesced_messages_total": ("counter", "Jabber text messages packed into those Webex messages"),
+    "migration_rooms_total": ("counter", "Jabber rooms migrated to Webex"),
+}
+
+# Global variables for the metrics of the run, shared by all the workers:
+# {(metric name, ((label, value), ...)): value} for counters, and {...: {"buckets": [...], "sum": ..., "count": ..., "max": ...}} for histograms
+counters = {}
+histograms = {}
+metrics_lock = threading.Lock()
+metrics_start_time = time.monotonic()
+
+# Global variables for the background thread writing the metrics file every METRICS_INTERVAL seconds
+metrics_writer = None
+metrics_writer_stop = threading.Event()
+# Name of the metrics file inside LOGS_FOLDER, i.e: with the shard of the run
+metrics_file_name = METRICS_FILE_NAME
+
+
+# Key of a metric in the counters/histograms: its name and its labels, sorted and as strings
+def metric_key(name, labels):
+    return (name, tuple(sorted((label, str(value)) for label, value in (labels or {}).items())))
+
+# Adding 'value' to a counter
+def count(name, labels=None, value=1):
+    key = metric_key(name, labels)
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value
+
+# Adding a duration, in seconds, to a latency histogram
+def observe(name, labels, seconds):
+    key = metric_key(name, labels)
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if(histogram is None):
+            histogram = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0, "max": 0.0}
+            histograms[key] = histogram
+        for i, bucket in enumerate(LATENCY_BUCKETS):
+            if(seconds <= bucket):
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+        histogram["max"] = max(histogram["max"], seconds)
+
+# Timing a block of code into a latency histogram, i.e: with timed("migration_db_query_seconds", {"query": "rooms"}):
+@contextmanager
+def timed(name, labels=None):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, labels, time.monotonic() - start)
+
+# Formatting the labels of a metric as in the Prometheus text format: {label="value",...}
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if(len(labels) == 0):
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                          for name, value in labels) + '}'
+
+# Writing all the metrics in the Prometheus text format
+def metrics_to_prometheus_text():
+    with metrics_lock:
+        counters_copy = dict(counters)
+        histograms_copy = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in histograms.items()}
+
+    lines = []
+    for name, (metric_type, description) in METRICS_HELP.items():
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' ' + metric_type)
+        if(metric_type == "counter"):
+            for (metric_name, labels), value in sorted(counters_copy.items()):
+                if(metric_name == name):
+                    lines.append(name + format_labels(labels) + ' ' + str(value))
+        else:
+            for (metric_name, labels), histogram in sorted(histograms_copy.items()):
+                if(metric_name != name):
+                    continue
+                cumulative = 0
+                for bucket, bucket_count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                    cumulative += bucket_count
+                    lines.append(name + '_bucket' + format_labels(labels, (("le", bucket),)) + ' ' + str(cumulative))
+                lines.append(name + '_bucket' + format_labels(labels, (("le", "+Inf"),)) + ' ' + str(histogram["count"]))
+                lines.append(name + '_sum' + format_labels(labels) + ' ' + repr(histogram["sum"]))
+                lines.append(name + '_count' + format_labels(labels) + ' ' + str(histogram["count"]))
+    return '\n'.join(lines) + '\n'
+
+# Writing the metrics file in LOGS_FOLDER. Written to a temporary file first, so a scraper never reads half a file
+def write_metrics_file():
+    metrics_file = LOGS_FOLDER + metrics_file_name
+    try:
+        with open(metrics_file + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(metrics_to_prometheus_text())
+        os.replace(metrics_file + '.tmp', metrics_file)
+    except OSError:
+        logging.info('Warning: Unable to write the metrics file: ' + metrics_file)
+
+# Starting the background thread writing the metrics file every METRICS_INTERVAL seconds (0 to only write it at the end of the run).
+# 'file_name' is the name of the metrics file inside LOGS_FOLDER
+def start_metrics_writer(file_name=METRICS_FILE_NAME):
+    global metrics_writer, metrics_start_time, metrics_file_name
+    metrics_start_time = time.monotonic()
+    metrics_file_name = file_name
+
+    def write_periodically():
+        while(not metrics_writer_stop.wait(METRICS_INTERVAL)):
+            write_metrics_file()
+
+    if(METRICS_INTERVAL > 0 and metrics_writer is None):
+        metrics_writer_stop.clear()
+        metrics_writer = threading.Thread(target=write_periodically, name='Metrics', daemon=True)
+        metrics_writer.start()
+
+# Stopping the background thread, writing the metrics file a last time, and logging the summary of the run
+def stop_metrics_writer():
+    global metrics_writer
+    if(metrics_writer is not None):
+        metrics_writer_stop.set()
+        metrics_writer.join()
+        metrics_writer = None
+    write_metrics_file()
+    log_metrics_summary()
+
+# Logging the summary of the run's metrics: the latency of each kind of call, the Webex status codes and 429s,
+# the bytes transferred, and the messages per second
+def log_metrics_summary():
+    with metrics_lock:
+        counters_copy = dict(counters)
+        histograms_copy = {key: dict(h) for key, h in histograms.items()}
+
+    logging.info('-' * 25 + ' Metrics ' + '-' * 25)
+    for (name, labels), histogram in sorted(histograms_copy.items()):
+        average = histogram["sum"] / histogram["count"] if histogram["count"] > 0 else 0
+        logging.info('%s%s: %s calls, avg %.3fs, max %.3fs, total %.1fs', name, format_labels(labels), histogram["count"],
+                     average, histogram["max"], histogram["sum"])
+    for (name, labels), value in sorted(counters_copy.items()):
+        logging.info('%s%s: %s', name, format_labels(labels), value)
+
+    elapsed = time.monotonic() - metrics_start_time
+    messages = sum(value for (name, labels), value in counters_copy.items() if name == "migration_messages_total")
+    if(elapsed > 0):
+        logging.info('Messages per second: %.2f (%s messages in %.1f seconds)', messages / elapsed, messages, elapsed)
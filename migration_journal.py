@@ -0,0 +1,96 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import json
+import logging
+import threading
+
+from config import JOURNAL_FSYNC
+
+# Global variables to keep the journal file open for the whole run, shared by all the room workers
+journal_file = None
+journal_lock = threading.Lock()
+
+
+# Opening the append-only migration journal. Each line is a JSON record of something done in Webex:
+#   {"type": "archiver_user", "archiver_user": {...}}
+#   {"type": "shard", "shard": "K/N"}     (when the run migrates a shard of the rooms: --shard K/N)
+#   {"type": "room", "jabber_room": <room_jid>, "webex_room": {"title": ..., "id": ...}}
+#   {"type": "membership", "jabber_room": <room_jid>, "user": {...}}
+#   {"type": "message", "jabber_room": <room_jid>, "number": <n>, "msg_id": <msg_id>, "sent_date": ...}
+#   {"type": "room_completed", "jabber_room": <room_jid>}
+def open_migration_journal(file_path):
+    global journal_file
+    journal_file = open(file_path, 'a+', encoding='utf-8')
+    # Ending a record cut by the crash of a previous run, so the next records start on their own line
+    if(journal_file.tell() > 0):
+        journal_file.seek(journal_file.tell() - 1)
+        if(journal_file.read(1) != '\n'):
+            journal_file.write('\n')
+    logging.info('Migration journal: ' + file_path)
+
+# Appending a record to the journal. Each record is flushed as soon as it's written,
+# and also synced to disk if JOURNAL_FSYNC is set to True, so a crash doesn't lose the work already done
+def journal_record(record):
+    if(journal_file is None):
+        return
+    line = json.dumps(record) + '\n'
+    with journal_lock:
+        journal_file.write(line)
+        journal_file.flush()
+        if(JOURNAL_FSYNC):
+            os.fsync(journal_file.fileno())
+
+# Closing the journal at the end of the run
+def close_migration_journal():
+    global journal_file
+    with journal_lock:
+        if(journal_file is not None):
+            journal_file.close()
+            journal_file = None
+
+# Reading a journal written by a previous run, to resume it. Returns the archiver user, its shard (or None) and the progress of each room:
+#   {"archiver_user": {...}, "shard": "K/N", "rooms": {<room_jid>: {"webex_room": {...}, "room_users": [...],
+#                                                   "messages_posted": <n>, "last_msg_id": <msg_id>, "completed": True/False}}}
+def load_migration_journal(file_path):
+    journal = {"archiver_user": None, "shard": None, "rooms": {}}
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut if the previous run crashed while writing it
+                logging.info('Skipping an incomplete journal record: ' + line.strip())
+                continue
+            record_type = record.get("type")
+            if(record_type == "archiver_user"):
+                journal["archiver_user"] = record["archiver_user"]
+                continue
+            if(record_type == "shard"):
+                journal["shard"] = record["shard"]
+                continue
+            room_progress = journal["rooms"].setdefault(record["jabber_room"], {
+                "webex_room": None, "room_users": [], "messages_posted": 0, "last_msg_id": None, "completed": False})
+            if(record_type == "room"):
+                room_progress["webex_room"] = record["webex_room"]
+            elif(record_type == "membership"):
+                room_progress["room_users"].append(record["user"])
+            elif(record_type == "message" and record["number"] > room_progress["messages_posted"]):
+                room_progress["messages_posted"] = record["number"]
+                room_progress["last_msg_id"] = record.get("msg_id")
+            elif(record_type == "room_completed"):
+                room_progress["completed"] = True
+    return journal
@@ -0,0 +1,87 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import json
+import queue
+import atexit
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_MESSAGE_DETAILS, LOG_JSON_LINES
+
+# Logger of the details of each message and of its Webex API calls. Its lines are only written if LOG_MESSAGE_DETAILS is set to True,
+# and are formatted lazily ('%s' arguments), so they cost nearly nothing when turned off
+message_log = logging.getLogger('messages')
+
+# Global variable for the background thread writing the log lines to the log file, the console and the JSON-lines log
+log_listener = None
+
+
+# Passing the log records to the background thread as they are: they're formatted there, not in the room workers.
+# (QueueHandler formats them before queuing them by default, so they can be sent to other processes)
+class BackgroundQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+# Formatting a log record as a line of JSON, for the JSON-lines log:
+# {"time": ..., "level": ..., "thread": ..., "logger": ..., "message": ..., "data": {...}}
+# 'data' has the structured details given with the record as extra={"data": {...}}, i.e: the summary of a room
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        line = {"time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                "level": record.levelname, "thread": record.threadName, "logger": record.name,
+                "message": record.getMessage()}
+        if(hasattr(record, 'data')):
+            line["data"] = record.data
+        if(record.exc_info):
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+# Setting up the logs of a script: the log file and the console, plus a JSON-lines log next to the log file if LOG_JSON_LINES is set to True.
+# The lines are written by a background thread, so the room workers only put them in a queue and never wait for the disk or the console
+def setup_migration_logging(log_file_name, show_thread_name=False):
+    global log_listener
+    log_format = '%(asctime)s - %(message)s'
+    if(show_thread_name):
+        log_format = '%(asctime)s - %(threadName)s - %(message)s'
+    formatter = logging.Formatter(log_format, datefmt='%Y/%m/%d %I:%M:%S')
+
+    handlers = [logging.FileHandler(log_file_name), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if(LOG_JSON_LINES):
+        json_handler = logging.FileHandler(log_file_name + '.jsonl', encoding='utf-8')
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(BackgroundQueueHandler(log_queue))
+    if(not LOG_MESSAGE_DETAILS):
+        message_log.setLevel(logging.WARNING)
+    # The lines still in the queue are also written when the script ends with exit()
+    atexit.register(stop_migration_logging)
+
+# Writing the log lines left in the queue and stopping the background thread, at the end of the script
+def stop_migration_logging():
+    global log_listener
+    if(log_listener is not None):
+        log_listener.stop()
+        log_listener = None
@@ -13,10 +13,17 @@ writing, software distributed under the License is distributed on an "AS
 IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
-import requests
+import time
+# Time the script started, to report the startup time
+START_TIME = time.monotonic()
+
 import json
 import logging
-from config import WEBEX_AUTH, LOGS_FOLDER
+from config import LOGS_FOLDER, MEMBERSHIP_WORKERS
+from webex_client import webex_api_request, webex_api_call_concurrently
+from webex_rooms_index import webex_get_my_memberships_index
+from webex_summary import read_webex_summary
+from migration_logging import setup_migration_logging
 
 # Global variable to store the information for the user running this script
 global archiver_info
@@ -26,23 +33,27 @@ global archiver_info
 def rollback():
     global archiver_info
     
+    # The time spent waiting for the file name isn't part of the startup time
+    input_start = time.monotonic()
     json_file_name = input('Please enter (or paste) the file name of Webex Json Summary to rollback:\n')
+    input_time = time.monotonic() - input_start
     
+    # The summary is read one room at a time, on each pass over its rooms
+    summary_file_path = LOGS_FOLDER + json_file_name
     try:
-        with open(LOGS_FOLDER + json_file_name) as f:
-            json_data = json.load(f)
+        next(read_webex_summary(summary_file_path), None)
     except:
         logging.info('File failed to load. Please make sure of the file name and location')
         exit()
     
     # Setting up the logger to store the rollback process
-    logging.basicConfig(filename=LOGS_FOLDER + json_file_name + ' -Rollback.log', level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
-    logging.getLogger().addHandler(logging.StreamHandler())
+    setup_migration_logging(LOGS_FOLDER + json_file_name + ' -Rollback.log')
     logging.info("-"*25 + " Started " + "-"*25)
     logging.info('File: '+ json_file_name)
+    logging.info('Startup time: ' + str(round(time.monotonic() - START_TIME - input_time, 2)) + ' seconds')
 
     # Read the json file and display the summary of the data that was found
-    display_found_rooms_and_users(json_data)
+    display_found_rooms_and_users(summary_file_path)
     
     # Ask the user for confirmation to delete the rooms or exit
     confirm_to_delete_or_exit()
@@ -51,10 +62,10 @@ def rollback():
     archiver_info = webex_api_get_archiver_details()
 
     # Remove the list of rooms by emptying it from users
-    remove_found_rooms_and_users(json_data)
+    remove_found_rooms_and_users(summary_file_path)
 
     # After removing the users from the rooms, ask the archiver user if to leave the created rooms
-    archiver_leaving_all_rooms(json_data)
+    archiver_leaving_all_rooms(summary_file_path)
 
     logging.info('-'*20 + ' Ending the application ' + '-'*20)
 
@@ -63,12 +74,9 @@ def webex_api_get_archiver_details():
     global archiver_info
     try:
         archiver_info = {"id": "", "email": ""}
-        url = "https://webexapis.com/v1/people/me"
+        endpoint = "people/me"
         payload = {}
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = webex_api_request("GET", endpoint, data=payload)
         res_dict = json.loads(response.text)
         archiver_info["id"] = res_dict["id"]
         archiver_info["email"] = res_dict["emails"][0]
@@ -78,42 +86,70 @@ def webex_api_get_archiver_details():
         logging.info('Error getting Webex\'s archiver user details..')
         exit()
 
-# Webex API - Removing a user from a room usingthe room Id and the user's email. Using Memberships APIs
-def webex_api_remove_user_from_room(w_room_id, w_user_email):
-    global archiver_info
-    w_memb_id = ''
+# Webex API - Removing a user from a room. Using Memberships APIs.
+# The membership is deleted directly when its ID was recorded in the summary ('w_memb_id'), otherwise it's looked up first
+# with the room Id and the user's email. Returns "removed", "not_found" (the user is no longer part of the room) or "error"
+def webex_api_remove_user_from_room(w_room_id, w_user_email, w_memb_id=None):
     logging.info('-'*3 + 'Calling Webex API to remove user: ' + w_user_email)
 
-    # List the existing webex memberships
-    logging.info('-'*3 + ' Calling Webex API to get the user\'s membership:')
-    url = "https://webexapis.com/v1/memberships" + "?roomId=" + w_room_id + "&personEmail=" + w_user_email
-    payload = {}
-    headers = {
-        'Authorization': WEBEX_AUTH
-    }
-    response = requests.request("GET", url, headers=headers, data=payload)
+    if(not w_memb_id):
+        # List the existing webex memberships
+        logging.info('-'*3 + ' Calling Webex API to get the user\'s membership: ' + w_user_email)
+        endpoint = "memberships"
+        response = webex_api_request("GET", endpoint, params={"roomId": w_room_id, "personEmail": w_user_email})
+        logging.info("\tResponse Code:" + str(response.status_code) +
+              ' (' + str(response.reason) + ') for: ' + w_user_email)
+        if(response.status_code == 401):
+            logging.info('Webex authentication credentials are missing or incorrect.\nEnding application...')
+            exit()
+        if(response.status_code != 200):
+            logging.info('Error getting the membership of: ' + w_user_email)
+            return "error"
+
+        res_dict = json.loads(response.text)
+        webex_memberships = res_dict["items"]
+
+        for w_memb in webex_memberships:
+            w_memb_id = w_memb["id"]
+
+        if(not w_memb_id):
+            logging.info('Membership not found. User is no longer part of the room: ' + w_user_email)
+            return "not_found"
+
+    # Delete a membership
+    logging.info('-'*3 + ' Calling Webex API to delete the membership of: ' + w_user_email)
+    endpoint = "memberships" + "/" + w_memb_id
+    response = webex_api_request("DELETE", endpoint)
     logging.info("\tResponse Code:" + str(response.status_code) +
-          ' (' + str(response.reason) + ')')
+      ' (' + str(response.reason) + ') for: ' + w_user_email)
+    if(response.status_code == 401):
+        logging.info('Webex authentication credentials are missing or incorrect.\nEnding application...')
+        exit()
+    if(response.status_code == 404):
+        logging.info('Membership not found. User is no longer part of the room: ' + w_user_email)
+        return "not_found"
+    if(response.status_code >= 400):
+        logging.info('Error removing user: ' + w_user_email + ' from the room..')
+        return "error"
+    return "removed"
 
-    res_dict = json.loads(response.text)
-    webex_memberships = res_dict["items"]
+# Removing memberships concurrently, read from an iterable of: (room Id, user's email, membership ID or None).
+# Up to MEMBERSHIP_WORKERS calls are sent at once, while the memberships are read (i.e: from the summary).
+# Logs the number of removed, not found, and failed memberships
+def remove_memberships(memberships):
+    results = {"removed": 0, "not_found": 0, "error": 0}
+    lookups = 0
 
-    for w_memb in webex_memberships:
-        w_memb_id = w_memb["id"]        
+    def record_result(membership, result):
+        nonlocal lookups
+        if(not membership[2]):
+            lookups += 1
+        results[result] += 1
 
-    if(w_memb_id == ''):
-        logging.info('Membership not found. User is no longer part of the room..')
-    else:
-        # Delete a membership
-        logging.info('-'*3 + ' Calling Webex API to delete the membership: ')
-        url = "https://webexapis.com/v1/memberships" + "/" + w_memb_id
-        payload = {}
-        headers = {
-            'Authorization': WEBEX_AUTH
-        }
-        response = requests.request("DELETE", url, headers=headers, data=payload)
-        logging.info("\tResponse Code:" + str(response.status_code) +
-          ' (' + str(response.reason) + ')')
+    webex_api_call_concurrently(webex_api_remove_user_from_room, memberships, record_result, MEMBERSHIP_WORKERS, 'Rollback')
+    logging.info('Memberships removed: ' + str(results["removed"]) + ', not found: ' + str(results["not_found"]) +
+                 ', errors: ' + str(results["error"]) + ' (' + str(lookups) + ' looked up without a recorded membership ID)')
+    return results
 
 # Ask the user for confirmation to delete the rooms or exit
 def confirm_to_delete_or_exit():
@@ -136,10 +172,9 @@ def confirm_to_delete_or_exit():
         logging.info('*'*3 + ' Starting the rollback process ' + '*'*3)
 
 # Read the json file and display the summary of the data that was found
-def display_found_rooms_and_users(json_data):
-    # logging.info('Data:\n' + str(json_data))
+def display_found_rooms_and_users(summary_file_path):
     num_of_rooms = 0
-    for element in json_data:
+    for element in read_webex_summary(summary_file_path):
         # logging.info('Element:' + str(element))
         if "webex_room" in element:
             num_of_rooms += 1
@@ -151,12 +186,17 @@ def display_found_rooms_and_users(json_data):
                 logging.info('\t' + str(num_of_users) + '- User: ' + user["email"])
 
 # Remove the list of rooms by emptying it from users
-def remove_found_rooms_and_users(json_data):
+def remove_found_rooms_and_users(summary_file_path):
+    # The memberships of all the rooms are removed concurrently, directly by their recorded IDs
+    remove_memberships(summary_memberships(summary_file_path))
+
+# Reading the memberships to remove from the summary, one room at a time: (room Id, user's email, membership ID or None)
+def summary_memberships(summary_file_path):
     global archiver_info
     num_of_rooms = 0
     w_room_id = ''
     w_user_email = ''
-    for element in json_data:
+    for element in read_webex_summary(summary_file_path):
         if "webex_room" in element:
             num_of_rooms += 1
             logging.info('#'*5 + ' Room #' + str(num_of_rooms) + ': ' + element["webex_room"]["title"])
@@ -171,10 +211,10 @@ def remove_found_rooms_and_users(json_data):
                     continue
                 else:
                     logging.info('\t' + str(num_of_users) + '- User: ' + user["email"])
-                    webex_api_remove_user_from_room(w_room_id,w_user_email)
+                    yield (w_room_id, w_user_email, user.get("membershipId"))
 
 # After removing the users from the rooms, ask the archiver user if to leave the created rooms
-def archiver_leaving_all_rooms(json_data):
+def archiver_leaving_all_rooms(summary_file_path):
     global archiver_info
 
     invalid_choice = True
@@ -193,15 +233,29 @@ def archiver_leaving_all_rooms(json_data):
         else:
             logging.info('Incorrect choice,, please check your input')
     if(leave_rooms):
-        num_of_rooms = 0
-        w_room_id = ''
-        for element in json_data:
-            if "webex_room" in element:
-                num_of_rooms += 1
-                logging.info('#'*5 + ' Room #' + str(num_of_rooms) + ': ' + element["webex_room"]["title"])
-                w_room_id = element["webex_room"]["id"]
-            if "room_users" in element:
-                webex_api_remove_user_from_room(w_room_id,archiver_info["email"])
+        # All the archiver's memberships are listed once, then its membership in each room is found in the index
+        try:
+            w_memberships = webex_get_my_memberships_index()
+        except Exception:
+            logging.info('Error listing the memberships of the archiver user..')
+            exit()
+        remove_memberships(summary_archiver_memberships(summary_file_path, w_memberships))
+
+# Reading the archiver's memberships to remove from the summary, one room at a time, with their IDs from the archiver's memberships index
+def summary_archiver_memberships(summary_file_path, w_memberships):
+    num_of_rooms = 0
+    w_room_id = ''
+    for element in read_webex_summary(summary_file_path):
+        if "webex_room" in element:
+            num_of_rooms += 1
+            logging.info('#'*5 + ' Room #' + str(num_of_rooms) + ': ' + element["webex_room"]["title"])
+            w_room_id = element["webex_room"]["id"]
+        if "room_users" in element:
+            if(w_room_id in w_memberships):
+                yield (w_room_id, archiver_info["email"], w_memberships[w_room_id])
+            else:
+                logging.info('The archiver user is no longer part of the room..')
 
                 
-rollback()
\ No newline at end of file
+if __name__ == '__main__':
+    rollback()
@@ -0,0 +1,100 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from message_pipeline import run_pipeline
+
+
+# Names of the threads of the pipelines still running, started with the given name
+def pipeline_threads(name):
+    return [thread.name for thread in threading.enumerate() if thread.name.startswith(name + '-')]
+
+
+# Tests of run_pipeline: the order of its results, its in-flight limit, its errors and its threads being stopped.
+# Run with: python -m unittest discover tests
+class RunPipelineTest(unittest.TestCase):
+
+    # The first item is the slowest of a stage with several workers, so the next ones finish before it,
+    # and are still yielded in the order of the source
+    def test_results_keep_the_source_order(self):
+        finished = []
+
+        def slow_first(item):
+            time.sleep(0.2 if item == 0 else 0.001)
+            finished.append(item)
+            return item * 10
+
+        results = list(run_pipeline(range(20), [("Slow", slow_first, 4), ("Add", lambda item: item + 1, 2)], 8, name='Order'))
+        self.assertNotEqual(finished[0], 0)
+        self.assertEqual(results, [item * 10 + 1 for item in range(20)])
+        self.assertEqual(pipeline_threads('Order'), [])
+
+    # While the caller holds the first result, at most 'max_in_flight' items are read ahead of it
+    # (plus the one the reader waits to put in the pipeline)
+    def test_items_in_flight_are_bounded(self):
+        read = []
+
+        def source():
+            for item in range(100):
+                read.append(item)
+                yield item
+
+        pipeline = run_pipeline(source(), [("Stage", lambda item: item, 2)], 5, name='Bounded')
+        self.assertEqual(next(pipeline), 0)
+        time.sleep(0.5)
+        self.assertEqual(len(read), 5 + 1)
+        self.assertEqual(list(pipeline), list(range(1, 100)))
+        self.assertEqual(pipeline_threads('Bounded'), [])
+
+    # An exception raised by a stage is raised again to the caller, and the pipeline's threads are stopped
+    def test_stage_error_reaches_the_caller(self):
+        def fail_on_five(item):
+            if(item == 5):
+                raise ValueError('item 5')
+            return item
+
+        results = []
+        with self.assertRaises(ValueError):
+            for item in run_pipeline(range(100), [("Fail", fail_on_five, 3)], 10, name='Error'):
+                results.append(item)
+        self.assertEqual(results, list(range(len(results))))
+        self.assertLessEqual(len(results), 5)
+        self.assertEqual(pipeline_threads('Error'), [])
+
+    # exit() in a stage ends the caller too
+    def test_stage_exit_reaches_the_caller(self):
+        def stage_exit(item):
+            exit()
+
+        with self.assertRaises(SystemExit):
+            list(run_pipeline(range(10), [("Exit", stage_exit, 1)], 10, name='Exit'))
+        self.assertEqual(pipeline_threads('Exit'), [])
+
+    # Closing the pipeline before the end of the source, i.e: when the caller failed, stops its threads
+    def test_close_stops_the_threads(self):
+        pipeline = run_pipeline(iter(range(100)), [("Stage", lambda item: item, 2)], 5, name='Close')
+        self.assertEqual(next(pipeline), 0)
+        pipeline.close()
+        self.assertEqual(pipeline_threads('Close'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
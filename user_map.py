@@ -0,0 +1,105 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import os
+import pickle
+import logging
+import threading
+
+from config import LOGS_FOLDER, INCLUDE_JABBER_WEBEX_MAP, USER_MAP_DOMAIN_FALLBACK
+from config import JABBER_DOMAIN, WEBEX_DOMAIN
+from atomic_file import atomic_write
+
+# Compiled user map, kept between runs until the Excel file changes:
+#   {"source": ..., "mtime": ..., "size": ..., "map": {<lowercase jabber_id>: <webex_email>}}
+USER_MAP_CACHE_FILE = LOGS_FOLDER + 'jabber_to_webex map cache.pickle'
+
+# Global variables for the loaded user map, and the Jabber IDs missing from it (to only warn once about each of them)
+user_map = {}
+unmapped_users = set()
+unmapped_users_lock = threading.Lock()
+
+
+# Loading the Excel file that maps Jabber IDs to Webex emails ('jabber_id' and 'webex_email' columns).
+# The compiled map is cached in LOGS_FOLDER, and only read again from the Excel file when the file was modified
+def load_user_map(xlsx_path):
+    global user_map
+    xlsx_stat = os.stat(xlsx_path)
+    source = os.path.realpath(xlsx_path)
+    try:
+        with open(USER_MAP_CACHE_FILE, 'rb') as f:
+            cache = pickle.load(f)
+        if(cache["source"] == source and cache["mtime"] == xlsx_stat.st_mtime_ns and cache["size"] == xlsx_stat.st_size):
+            user_map = cache["map"]
+            logging.info('Loaded ' + str(len(user_map)) + ' users from the user map cache')
+            return user_map
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logging.info('Warning: Unable to read the user map cache, reading the Excel file again..')
+
+    user_map = read_user_map_xlsx(xlsx_path)
+    logging.info('Loaded ' + str(len(user_map)) + ' users from: ' + xlsx_path)
+    try:
+        with atomic_write(USER_MAP_CACHE_FILE, 'wb') as f:
+            pickle.dump({"source": source, "mtime": xlsx_stat.st_mtime_ns, "size": xlsx_stat.st_size, "map": user_map},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        logging.info('Warning: Unable to save the user map cache..')
+    return user_map
+
+# openpyxl - Reading the map from the first sheet of the Excel file, row by row in read-only mode,
+# and only the 'jabber_id' and 'webex_email' columns. Jabber IDs are stored in lowercase
+def read_user_map_xlsx(xlsx_path):
+    # openpyxl is only loaded when the map is read from the Excel file, not when it's loaded from its cache
+    import openpyxl
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
+        header = [str(title).strip() if title is not None else '' for title in header]
+        jabber_column = header.index("jabber_id")
+        webex_column = header.index("webex_email")
+        first_column = min(jabber_column, webex_column)
+
+        xlsx_map = {}
+        for row in sheet.iter_rows(min_row=2, min_col=first_column + 1, max_col=max(jabber_column, webex_column) + 1, values_only=True):
+            jabber_id = row[jabber_column - first_column]
+            webex_email = row[webex_column - first_column]
+            if(jabber_id is None or webex_email is None):
+                continue
+            xlsx_map[str(jabber_id).strip().lower()] = str(webex_email).strip()
+        return xlsx_map
+    finally:
+        workbook.close()
+
+# Getting the Webex email of a Jabber user. With INCLUDE_JABBER_WEBEX_MAP set to True, it's looked up in the user map
+# regardless of its case; a user missing from the map is rewritten from JABBER_DOMAIN to WEBEX_DOMAIN
+# if USER_MAP_DOMAIN_FALLBACK is set to True, otherwise kept as is
+def webex_user_email(jabber_id):
+    if(not INCLUDE_JABBER_WEBEX_MAP):
+        # This step is only needed if the domain of Jabber IM is different than Webex environment
+        return jabber_id.replace(JABBER_DOMAIN, WEBEX_DOMAIN)
+
+    webex_email = user_map.get(jabber_id.lower())
+    if(webex_email is not None):
+        return webex_email
+    with unmapped_users_lock:
+        if(jabber_id not in unmapped_users):
+            unmapped_users.add(jabber_id)
+            logging.info('Warning: ' + jabber_id + ' is not in the user map..')
+    if(USER_MAP_DOMAIN_FALLBACK):
+        return jabber_id.replace(JABBER_DOMAIN, WEBEX_DOMAIN)
+    return jabber_id
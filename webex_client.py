@@ -0,0 +1,214 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import time
+import logging
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from metrics import count, observe
+
+# Importing Webex's Auth, the HTTP connection settings and the rate limits
+from config import WEBEX_AUTH, WEBEX_API_URL, WEBEX_HTTP_POOL_SIZE
+from config import WEBEX_RATE_LIMITS, WEBEX_MAX_RETRIES, WEBEX_RETRY_BACKOFF
+
+# Number of items per page when listing Webex endpoints (the most accepted by Webex)
+WEBEX_PAGE_SIZE = 1000
+
+# Global variable to keep the single Webex session shared by all the scripts and their workers
+webex_session = None
+webex_session_lock = threading.Lock()
+
+# Global variables for the rate limiter: one token bucket per class of endpoints,
+# and the time until which all the calls are on hold after Webex answered with 429
+rate_limit_buckets = {}
+rate_limit_blocked_until = 0.0
+rate_limit_lock = threading.Lock()
+
+# Seconds to wait after a 429 response that has no valid Retry-After header
+DEFAULT_RETRY_AFTER = 5
+
+# Longest wait in seconds before retrying a call that failed with a server error (5xx) or a connection error
+MAX_RETRY_BACKOFF = 60
+
+
+# requests - Getting the shared Webex session, creating it on first use.
+# The session keeps a pool of keep-alive connections to Webex, so the TCP/TLS handshake is
+# done once per pooled connection instead of once per API call, and has the Authorization header pre-built
+def get_webex_session():
+    global webex_session
+    with webex_session_lock:
+        if(webex_session is None):
+            session = requests.Session()
+            # pool_block: workers wait for a free connection instead of opening extra ones that would be thrown away
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEBEX_HTTP_POOL_SIZE, pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'Authorization': WEBEX_AUTH})
+            webex_session = session
+    return webex_session
+
+# Webex API - Sending a request to Webex using the shared session, under the rate limit of its class of endpoints.
+# 'endpoint' is relative to WEBEX_API_URL (i.e: 'rooms', 'memberships/<id>'), or a full URL (i.e: a pagination link).
+# Requests answered with 429 are retried after the Retry-After header, up to WEBEX_MAX_RETRIES times.
+# Requests answered with a server error (5xx), or failing with a connection error or a timeout, are retried
+# after an exponential backoff, within the same WEBEX_MAX_RETRIES retries.
+# 'payload_builder' is used for payloads that can only be sent once (i.e: file uploads):
+# it is called before each try and returns the extra arguments of the request (i.e: data & headers)
+def webex_api_request(method, endpoint, payload_builder=None, **kwargs):
+    if(endpoint.startswith('http://') or endpoint.startswith('https://')):
+        url = endpoint
+    else:
+        url = WEBEX_API_URL + endpoint
+    endpoint_class = webex_endpoint_class(url)
+
+    retries = 0
+    while(True):
+        webex_rate_limit_wait(endpoint_class)
+        request_args = dict(kwargs)
+        if(payload_builder is not None):
+            request_args.update(payload_builder())
+        start = time.monotonic()
+        try:
+            response = get_webex_session().request(method, url, **request_args)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            count("migration_webex_responses_total", {"endpoint": endpoint_class, "status": "error"})
+            if(retries >= WEBEX_MAX_RETRIES):
+                raise
+            retries += 1
+            webex_retry_backoff(endpoint_class, retries, type(error).__name__)
+            continue
+        except Exception:
+            count("migration_webex_responses_total", {"endpoint": endpoint_class, "status": "error"})
+            raise
+        finally:
+            observe("migration_webex_request_seconds", {"endpoint": endpoint_class, "method": method}, time.monotonic() - start)
+        count("migration_webex_responses_total", {"endpoint": endpoint_class, "status": response.status_code})
+
+        # Handling server errors (5xx): only this call waits, then it's sent again
+        if(response.status_code >= 500 and retries < WEBEX_MAX_RETRIES):
+            retries += 1
+            webex_retry_backoff(endpoint_class, retries, str(response.status_code) + ' (' + str(response.reason) + ')')
+            continue
+
+        # Handling 429: all the workers hold on until Retry-After is over, then the call is sent again
+        if(response.status_code == 429):
+            count("migration_webex_429_total", {"endpoint": endpoint_class})
+        if(response.status_code != 429 or retries >= WEBEX_MAX_RETRIES):
+            return response
+        retries += 1
+        count("migration_webex_retries_total", {"endpoint": endpoint_class})
+        try:
+            retry_after = float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+        except ValueError:
+            retry_after = DEFAULT_RETRY_AFTER
+        logging.info('Too many requests have been sent in a given amount of time... Retrying after: ' +
+                     str(retry_after) + ' seconds (' + str(retries) + '/' + str(WEBEX_MAX_RETRIES) + ')')
+        webex_rate_limit_backoff(retry_after)
+
+# Waiting before retrying a call that failed with a server error or a connection error: WEBEX_RETRY_BACKOFF seconds,
+# doubled on each retry of the call, up to MAX_RETRY_BACKOFF seconds
+def webex_retry_backoff(endpoint_class, retries, error):
+    count("migration_webex_retries_total", {"endpoint": endpoint_class})
+    backoff = min(WEBEX_RETRY_BACKOFF * 2 ** (retries - 1), MAX_RETRY_BACKOFF)
+    logging.info('Webex API error: ' + error + '... Retrying after: ' + str(backoff) + ' seconds (' +
+                 str(retries) + '/' + str(WEBEX_MAX_RETRIES) + ')')
+    time.sleep(backoff)
+
+# Webex API - Listing all the items of a Webex endpoint (i.e: 'rooms', 'memberships'), page by page.
+# Pages of up to WEBEX_PAGE_SIZE items are requested, and the next page is read from the 'Link' header of each response.
+# Yields the items one by one; raises requests.HTTPError if a page fails (401 ends the application)
+def webex_api_paginate(endpoint, params=None):
+    request_params = dict(params or {})
+    request_params.setdefault('max', WEBEX_PAGE_SIZE)
+    next_page = endpoint
+    while(next_page is not None):
+        response = webex_api_request("GET", next_page, params=request_params)
+        if(response.status_code == 401):
+            logging.info('Webex authentication credentials are missing or incorrect.\nEnding application...')
+            exit()
+        response.raise_for_status()
+        for item in response.json()["items"]:
+            yield item
+        # The next page link already has all the query parameters
+        next_page = response.links.get('next', {}).get('url')
+        request_params = None
+
+# Webex API - Calling 'call(*item)' for each item of an iterable, by 'workers' concurrent calls, still under the rate limits shared by all the calls.
+# Only a few calls are queued ahead of the workers, so the items are read (i.e: from the summary) as they are called.
+# 'on_result(item, result)' is called in the caller's thread, in the order of the items; a call that raised gets the result "error"
+def webex_api_call_concurrently(call, items, on_result, workers, thread_name_prefix='Webex'):
+    def record_result(item, call_future):
+        try:
+            result = call_future.result()
+        except Exception:
+            logging.info('Error calling Webex API..')
+            result = "error"
+        on_result(item, result)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix) as executor:
+        call_futures = deque()
+        for item in items:
+            call_futures.append((item, executor.submit(call, *item)))
+            if(len(call_futures) >= workers * 4):
+                record_result(*call_futures.popleft())
+        while(len(call_futures) > 0):
+            record_result(*call_futures.popleft())
+
+# Getting the class of a Webex endpoint, to pick its rate limit: 'messages', 'memberships', 'rooms' or 'default'
+def webex_endpoint_class(url):
+    endpoint = url
+    if(url.startswith(WEBEX_API_URL)):
+        endpoint = url[len(WEBEX_API_URL):]
+    endpoint = endpoint.split('?')[0].split('/')[0]
+    if(endpoint in WEBEX_RATE_LIMITS):
+        return endpoint
+    return 'default'
+
+# Token bucket - Waiting for a free slot in the rate limit of the given class of endpoints.
+# Each class gets WEBEX_RATE_LIMITS[class] requests per second, with bursts up to one second's worth of requests,
+# so the calls are slowed down before Webex starts answering with 429
+def webex_rate_limit_wait(endpoint_class):
+    rate = WEBEX_RATE_LIMITS.get(endpoint_class, WEBEX_RATE_LIMITS['default'])
+    capacity = max(rate, 1)
+    while(True):
+        with rate_limit_lock:
+            now = time.monotonic()
+            wait = rate_limit_blocked_until - now
+            if(wait <= 0):
+                bucket = rate_limit_buckets.setdefault(endpoint_class, {"tokens": capacity, "updated": now})
+                bucket["tokens"] = min(capacity, bucket["tokens"] + (now - bucket["updated"]) * rate)
+                bucket["updated"] = now
+                if(bucket["tokens"] >= 1):
+                    bucket["tokens"] -= 1
+                    return
+                wait = (1 - bucket["tokens"]) / rate
+        time.sleep(wait)
+
+# Putting all the Webex API calls on hold for 'retry_after' seconds, after Webex answered with 429
+def webex_rate_limit_backoff(retry_after):
+    global rate_limit_blocked_until
+    with rate_limit_lock:
+        rate_limit_blocked_until = max(rate_limit_blocked_until, time.monotonic() + retry_after)
+
+# Closing the pooled connections, once all the Webex API calls are done
+def close_webex_session():
+    global webex_session
+    with webex_session_lock:
+        if(webex_session is not None):
+            webex_session.close()
+            webex_session = None
@@ -0,0 +1,100 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import re
+import json
+import logging
+
+from config import LOGS_FOLDER, WEBEX_ROOMS_CACHE, WEBEX_ROOMS_TITLE_NORMALIZE
+from webex_client import webex_api_paginate
+from atomic_file import atomic_write
+
+# Local cache of the archiver's Webex group rooms, kept between runs, one file per archiver user (i.e: shards run with different tokens):
+#   {"rooms": {<room_id>: {"title": ..., "lastActivity": ...}}}
+WEBEX_ROOMS_CACHE_FILE = LOGS_FOLDER + 'Webex rooms cache - {archiver}.json'
+
+
+# Webex API - Getting the index of the memberships of the user running the script, by room: {room_id: membership_id}. Using Memberships APIs.
+# Listing the memberships without a room lists all of the user's memberships, read once in pages of up to 1000,
+# instead of looking up the user's membership in each room
+def webex_get_my_memberships_index():
+    logging.info('-' * 5 + ' Calling Webex API to list all the memberships of the archiver user')
+    memberships = {}
+    for w_membership in webex_api_paginate("memberships"):
+        memberships[w_membership["roomId"]] = w_membership["id"]
+    logging.info('\tMemberships of the archiver user: ' + str(len(memberships)))
+    return memberships
+
+# Getting the key of a room title in the rooms index. With WEBEX_ROOMS_TITLE_NORMALIZE set to True,
+# titles are matched regardless of their case and of their extra spaces (i.e: 'Team  Room' and 'team room')
+def webex_room_title_key(title):
+    if(WEBEX_ROOMS_TITLE_NORMALIZE):
+        return ' '.join(str(title).split()).casefold()
+    return title
+
+# Webex API - Getting the index of the existing Webex group rooms by title: {title key: [room_id, ...]}. Using Rooms APIs.
+# All the pages of rooms are read, most recently active first. With WEBEX_ROOMS_CACHE set to True, the rooms are kept
+# in a local cache of the archiver user (its email: 'archiver_email'), and the next runs only read the rooms active since
+# the most recent activity in the cache
+def webex_get_rooms_index(archiver_email):
+    cache_file = webex_rooms_cache_file(archiver_email)
+    rooms = {}
+    if(WEBEX_ROOMS_CACHE):
+        rooms = load_webex_rooms_cache(cache_file)
+    last_activity = max((room["lastActivity"] for room in rooms.values()), default=None)
+    if(last_activity is None):
+        logging.info('-' * 5 + ' Calling Webex API to list all the existing rooms')
+    else:
+        logging.info('-' * 5 + ' Calling Webex API to list the rooms active since: ' + last_activity + ' (' +
+                     str(len(rooms)) + ' rooms in the cache)')
+
+    num_of_updates = 0
+    for w_room in webex_api_paginate("rooms", {"type": "group", "sortBy": "lastactivity"}):
+        # The rooms are sorted by their last activity: the rest of them are already in the cache.
+        # Timestamps from Webex have the same ISO format, so they can be compared as strings
+        w_room_activity = w_room.get("lastActivity", w_room.get("created", ""))
+        if(last_activity is not None and w_room_activity < last_activity):
+            break
+        rooms[w_room["id"]] = {"title": w_room["title"], "lastActivity": w_room_activity}
+        num_of_updates += 1
+    logging.info('\tRooms read from Webex: ' + str(num_of_updates) + ', existing rooms: ' + str(len(rooms)))
+
+    if(WEBEX_ROOMS_CACHE):
+        save_webex_rooms_cache(cache_file, rooms)
+
+    rooms_index = {}
+    for room_id, room in rooms.items():
+        rooms_index.setdefault(webex_room_title_key(room["title"]), []).append(room_id)
+    return rooms_index
+
+# Getting the path of the archiver user's cache of Webex rooms, with only the characters of its email that are safe in a file name
+def webex_rooms_cache_file(archiver_email):
+    return WEBEX_ROOMS_CACHE_FILE.format(archiver=re.sub(r'[^\w@.+-]', '_', archiver_email))
+
+# Reading the local cache of Webex rooms, if there is one
+def load_webex_rooms_cache(cache_file):
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            return json.load(f)["rooms"]
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError):
+        logging.info('Warning: Unable to read the Webex rooms cache, all the rooms will be listed again..')
+        return {}
+
+# Saving the local cache of Webex rooms, atomically so an interrupted run doesn't leave half a cache
+def save_webex_rooms_cache(cache_file, rooms):
+    with atomic_write(cache_file, 'w', encoding='utf-8') as f:
+        json.dump({"rooms": rooms}, f)
@@ -0,0 +1,152 @@
+"""Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+import sys
+import json
+import logging
+import threading
+
+# Global variables to keep the summary file open for the whole run, shared by all the room workers
+summary_file = None
+summary_lock = threading.Lock()
+
+
+# Opening the Webex json summary of a run. It's written one line per record, as soon as each room is migrated:
+#   {"archiver_user": {"id": ..., "email": ...}}     (with "shard": "K/N" when the run migrated a shard of the rooms)
+#   {"jabber_room": <room_jid>, "webex_room": {"title": ..., "id": ...}, "room_users": [{"email": ..., "membershipId": ..., ...}, ...]}
+# Each room's record is complete on its own, so the rooms can be written in any order, and the file is read one record at a time
+def open_webex_summary(file_path):
+    global summary_file
+    summary_file = open(file_path, 'w', encoding='utf-8')
+    logging.info('Webex json summary: ' + file_path)
+
+# Writing a record to the summary, flushed as soon as it's written
+def write_summary_record(record):
+    if(summary_file is None):
+        return
+    line = json.dumps(record) + '\n'
+    with summary_lock:
+        summary_file.write(line)
+        summary_file.flush()
+
+# Closing the summary at the end of the run
+def close_webex_summary():
+    global summary_file
+    with summary_lock:
+        if(summary_file is not None):
+            summary_file.close()
+            summary_file = None
+
+# Reading a Webex json summary one record at a time, without loading the whole file.
+# Summaries written before the json-lines format (a single json list, where each room's "room_users" follows its "webex_room")
+# are still read, but loaded whole: convert them once with 'python webex_summary.py <summary.json>'
+def read_webex_summary(file_path):
+    with open(file_path, encoding='utf-8') as f:
+        first_char = f.read(1)
+        while(first_char.isspace()):
+            first_char = f.read(1)
+        f.seek(0)
+        if(first_char == '['):
+            for record in records_from_json_list(json.load(f)):
+                yield record
+            return
+        for line in f:
+            if(line.strip()):
+                yield json.loads(line)
+
+# Converting the elements of a summary in the json list format to self-contained records:
+# the "room_users" element is merged into the "webex_room" element before it
+def records_from_json_list(json_data):
+    room_record = None
+    for element in json_data:
+        if "archiver_user" in element:
+            yield {"archiver_user": element["archiver_user"]}
+        if "webex_room" in element:
+            if(room_record is not None):
+                yield room_record
+            room_record = {"webex_room": element["webex_room"], "room_users": []}
+        if "room_users" in element and room_record is not None:
+            room_record["room_users"].extend(element["room_users"])
+    if(room_record is not None):
+        yield room_record
+
+# Converting a summary in the json list format to the json-lines format
+def convert_webex_summary(json_file_path, jsonl_file_path):
+    num_of_records = 0
+    with open(jsonl_file_path, 'w', encoding='utf-8') as f:
+        for record in read_webex_summary(json_file_path):
+            f.write(json.dumps(record) + '\n')
+            num_of_records += 1
+    return num_of_records
+
+# Merging the summaries of the shards of a migration (main.py --shard K/N) into one summary, to rollback or leave all the rooms at once.
+# The archiver user of each shard is written first (once per archiver), then the rooms of each shard, read one record at a time.
+# A room found in several summaries (i.e: a shard run twice) is only written once.
+# Returns the number of rooms written, and logs the shards missing from the summaries
+def merge_webex_summaries(summary_file_paths, merged_file_path):
+    archivers = []
+    shards = set()
+    shard_count = None
+    for summary_file_path in summary_file_paths:
+        for record in read_webex_summary(summary_file_path):
+            if "archiver_user" in record:
+                if(record["archiver_user"] not in archivers):
+                    archivers.append(record["archiver_user"])
+                if(record.get("shard") is not None):
+                    shards.add(record["shard"])
+                    shard_count = int(record["shard"].split('/')[1])
+            # The archiver user is the first record of a summary
+            break
+
+    if(len(archivers) > 1):
+        logging.info('Warning: The shards were migrated by ' + str(len(archivers)) + ' archiver users: ' +
+                     ', '.join(archiver["email"] for archiver in archivers) +
+                     '. Each archiver can only rollback or leave the rooms it created')
+    if(shard_count is not None):
+        missing_shards = [str(shard_number) + '/' + str(shard_count) for shard_number in range(1, shard_count + 1)
+                          if(str(shard_number) + '/' + str(shard_count) not in shards)]
+        if(len(missing_shards) > 0):
+            logging.info('Warning: The summaries of these shards are missing: ' + ', '.join(missing_shards))
+
+    num_of_rooms = 0
+    merged_rooms = set()
+    with open(merged_file_path, 'w', encoding='utf-8') as f:
+        for archiver in archivers:
+            f.write(json.dumps({"archiver_user": archiver}) + '\n')
+        for summary_file_path in summary_file_paths:
+            for record in read_webex_summary(summary_file_path):
+                if "webex_room" not in record or record["webex_room"]["id"] in merged_rooms:
+                    continue
+                merged_rooms.add(record["webex_room"]["id"])
+                f.write(json.dumps(record) + '\n')
+                num_of_rooms += 1
+    return num_of_rooms
+
+
+if __name__ == '__main__':
+    # python webex_summary.py --merge "<merged summary>.jsonl" "<shard 1 summary>.jsonl" "<shard 2 summary>.jsonl" ...
+    if(len(sys.argv) >= 4 and sys.argv[1] == '--merge'):
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        merged_file_path = sys.argv[2]
+        print(str(merge_webex_summaries(sys.argv[3:], merged_file_path)) + ' rooms written to: ' + merged_file_path)
+        sys.exit()
+
+    # python webex_summary.py "<old summary>.json" ["<new summary>.jsonl"]
+    if(len(sys.argv) not in (2, 3)):
+        sys.exit('Usage: python webex_summary.py <summary.json> [<summary.jsonl>]\n'
+                 '       python webex_summary.py --merge <merged summary.jsonl> <shard summary.jsonl> ...')
+    json_file_path = sys.argv[1]
+    jsonl_file_path = sys.argv[2] if len(sys.argv) == 3 else json_file_path.rsplit('.json', 1)[0] + '.jsonl'
+    print(str(convert_webex_summary(json_file_path, jsonl_file_path)) + ' records written to: ' + jsonl_file_path)